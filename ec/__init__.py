@@ -14,13 +14,35 @@
 
 """Elastic Cloud context and HTTP client for pipes."""
 
+import asyncio
+import atexit
 import contextlib
+import gzip
+import random
+import sys
+import threading
+import time
 from logging import Logger
+from typing import Iterator, Optional
 
 import httpx
 from elastic.pipes.core import TRACE, Pipe
+from elastic.pipes.telemetry import httpcore_trace, pipe_span, record_httpx
 from typing_extensions import Annotated
 
+from .cache import ResponseCache
+from .retry import IDEMPOTENT_METHODS, RateLimiter, RetryPolicy
+
+# connection pools shared by all the pipes of the run, keyed by API URL and connection settings
+_pools = {}
+_clients_lock = threading.Lock()
+
+# response caches shared by all the pipes of the run, keyed by directory
+_caches = {}
+
+# rate limiters shared by all the pipes of the run, keyed by API URL
+_limiters = {}
+
 
 def handle_response(response: httpx.Response, log: Logger) -> dict:
     """Handle HTTP response: raise for status and parse JSON, logging errors.
@@ -49,8 +71,203 @@ def handle_response(response: httpx.Response, log: Logger) -> dict:
         return {}
 
 
+async def handle_async_response(response: httpx.Response, log: Logger) -> dict:
+    """Handle async HTTP response: raise for status and parse JSON, logging errors.
+
+    Args:
+        response: The async HTTP response to handle
+        log: Logger for debug output
+
+    Returns:
+        Parsed JSON response body
+
+    Raises:
+        httpx.HTTPStatusError: If the response status indicates an error
+    """
+    await response.aread()
+    return handle_response(response, log)
+
+
+def get_resources(info: dict) -> list:
+    """Get the info of all the resources of a deployment, of any kind."""
+    return [resource.get("info", {}) for resources in info.get("resources", {}).values() for resource in resources]
+
+
+def backoff(initial: float, maximum: float, factor: float = 2.0) -> Iterator[float]:
+    """Generate exponentially growing polling delays with jitter.
+
+    Each delay is drawn between half and the whole of the current interval,
+    which is multiplied by `factor` at every step up to `maximum`.
+
+    Args:
+        initial: The first polling interval, in seconds
+        maximum: The maximum polling interval, in seconds
+        factor: The interval growth factor
+
+    Yields:
+        The delay before the next poll, in seconds
+    """
+    interval = initial
+    while True:
+        yield random.uniform(interval / 2, interval)
+        interval = min(interval * factor, maximum)
+
+
+def compress_request(request: httpx.Request, min_size: Optional[int]) -> httpx.Request:
+    """Compress the request body with gzip if it's at least `min_size` bytes.
+
+    Streaming bodies and bodies already encoded are left untouched.
+
+    Args:
+        request: The HTTP request to compress
+        min_size: Minimum body size to compress, None disables compression
+
+    Returns:
+        The compressed request or the original one
+    """
+    if min_size is None or "Content-Encoding" in request.headers:
+        return request
+    try:
+        content = request.content
+    except httpx.RequestNotRead:
+        return request
+    if len(content) < min_size:
+        return request
+
+    content = gzip.compress(content)
+    headers = request.headers.copy()
+    headers["Content-Encoding"] = "gzip"
+    headers["Content-Length"] = str(len(content))
+    return httpx.Request(request.method, request.url, headers=headers, content=content, extensions=request.extensions)
+
+
+class Transport(httpx.BaseTransport):
+    """HTTP transport wrapper applying the Elastic Cloud request policies."""
+
+    def __init__(
+        self,
+        transport: httpx.BaseTransport,
+        gzip_min_size: Optional[int] = None,
+        cache: Optional[ResponseCache] = None,
+        limiter: Optional[RateLimiter] = None,
+        retry: Optional[RetryPolicy] = None,
+    ):
+        self.transport = transport
+        self.gzip_min_size = gzip_min_size
+        self.cache = cache
+        self.limiter = limiter
+        self.retry = retry
+
+    def send(self, request: httpx.Request) -> httpx.Response:
+        timings = {}
+        request.extensions["trace"] = httpcore_trace(timings)
+        start = time.time_ns()
+        attempt = 0
+        while True:
+            if self.limiter is not None:
+                time.sleep(self.limiter.reserve())
+            retryable = self.retry is not None and self.retry.retryable(request, attempt)
+            try:
+                response = self.transport.handle_request(request)
+            except httpx.TransportError as e:
+                if not retryable:
+                    record_httpx(request, None, start, service="elastic-cloud", timings=timings, retries=attempt, error=e)
+                    raise
+                time.sleep(self.retry.delay(attempt))
+            else:
+                if not retryable or not self.retry.should_retry(response):
+                    record_httpx(request, response, start, service="elastic-cloud", timings=timings, retries=attempt)
+                    return response
+                response.close()
+                time.sleep(self.retry.delay(attempt, response))
+            attempt += 1
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request = compress_request(request, self.gzip_min_size)
+        if self.cache is None:
+            return self.send(request)
+        key, entry = self.cache.prepare(request)
+        response = self.send(request)
+        if key is not None:
+            response.read()
+        return self.cache.complete(request, response, key, entry)
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncTransport(httpx.AsyncBaseTransport):
+    """Async HTTP transport wrapper applying the Elastic Cloud request policies."""
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        gzip_min_size: Optional[int] = None,
+        cache: Optional[ResponseCache] = None,
+        limiter: Optional[RateLimiter] = None,
+        retry: Optional[RetryPolicy] = None,
+    ):
+        self.transport = transport
+        self.gzip_min_size = gzip_min_size
+        self.cache = cache
+        self.limiter = limiter
+        self.retry = retry
+
+    async def send(self, request: httpx.Request) -> httpx.Response:
+        timings = {}
+        request.extensions["trace"] = httpcore_trace(timings, is_async=True)
+        start = time.time_ns()
+        attempt = 0
+        while True:
+            if self.limiter is not None:
+                await asyncio.sleep(self.limiter.reserve())
+            retryable = self.retry is not None and self.retry.retryable(request, attempt)
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError as e:
+                if not retryable:
+                    record_httpx(request, None, start, service="elastic-cloud", timings=timings, retries=attempt, error=e)
+                    raise
+                await asyncio.sleep(self.retry.delay(attempt))
+            else:
+                if not retryable or not self.retry.should_retry(response):
+                    record_httpx(request, response, start, service="elastic-cloud", timings=timings, retries=attempt, is_async=True)
+                    return response
+                await response.aclose()
+                await asyncio.sleep(self.retry.delay(attempt, response))
+            attempt += 1
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request = compress_request(request, self.gzip_min_size)
+        if self.cache is None:
+            return await self.send(request)
+        key, entry = self.cache.prepare(request)
+        response = await self.send(request)
+        if key is not None:
+            await response.aread()
+        return self.cache.complete(request, response, key, entry)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+@atexit.register
+def close_clients():
+    """Close all the shared connection pools."""
+    with _clients_lock:
+        while _pools:
+            _, pool = _pools.popitem()
+            pool.close()
+
+
 class Context(Pipe.Context):
-    """Elastic Cloud API context: auth key and base URL."""
+    """Elastic Cloud API context: auth key and base URL.
+
+    The connection pool is shared by all the pipes using the same API URL
+    and connection settings, connections are therefore kept alive and
+    reused across the whole run. Compression, caching, rate limiting and
+    retries are applied per pipe, on top of the shared pool.
+    """
 
     auth_key: Annotated[
         str,
@@ -62,16 +279,189 @@ class Context(Pipe.Context):
         Pipe.Config("ec-api-url"),
         Pipe.Help("Elastic Cloud API base URL"),
     ] = "https://api.elastic-cloud.com/api/v1"
+    http2: Annotated[
+        bool,
+        Pipe.Config("ec-http2"),
+        Pipe.Help("use HTTP/2 to multiplex the requests on a single connection"),
+        Pipe.Notes("requires the 'http2' extra (h2 package)"),
+    ] = False
+    max_connections: Annotated[
+        int,
+        Pipe.Config("ec-max-connections"),
+        Pipe.Help("maximum number of concurrent connections to the API"),
+    ] = 100
+    max_keepalive_connections: Annotated[
+        int,
+        Pipe.Config("ec-max-keepalive-connections"),
+        Pipe.Help("maximum number of idle connections kept alive"),
+    ] = 20
+    keepalive_expiry: Annotated[
+        float,
+        Pipe.Config("ec-keepalive-expiry"),
+        Pipe.Help("seconds an idle connection is kept alive"),
+    ] = 30.0
+    gzip_min_size: Annotated[
+        Optional[int],
+        Pipe.Config("ec-gzip-min-size"),
+        Pipe.Help("compress request bodies of at least this many bytes with gzip"),
+        Pipe.Notes("default: no request compression, responses are always accepted compressed"),
+    ] = None
+    cache: Annotated[
+        bool,
+        Pipe.Config("ec-cache"),
+        Pipe.Help("cache the GET responses and revalidate them with conditional requests"),
+    ] = False
+    cache_dir: Annotated[
+        Optional[str],
+        Pipe.Config("ec-cache-dir"),
+        Pipe.Help("directory where to persist the cached responses across runs"),
+        Pipe.Notes("default: responses are cached in memory for the run only"),
+    ] = None
+    cache_ttl: Annotated[
+        float,
+        Pipe.Config("ec-cache-ttl"),
+        Pipe.Help("seconds after which a cached response is evicted"),
+    ] = 3600
+    rate_limit: Annotated[
+        Optional[float],
+        Pipe.Config("ec-rate-limit"),
+        Pipe.Help("maximum number of API requests per second, shared by all the pipes"),
+        Pipe.Notes("default: no rate limit"),
+    ] = None
+    rate_burst: Annotated[
+        int,
+        Pipe.Config("ec-rate-burst"),
+        Pipe.Help("number of API requests allowed in a burst above the rate limit"),
+    ] = 10
+    retries: Annotated[
+        int,
+        Pipe.Config("ec-retries"),
+        Pipe.Help("maximum number of retries on connection errors and 429, 502, 503, 504 responses"),
+        Pipe.Notes("the Retry-After header is honored"),
+    ] = 3
+    retry_methods: Annotated[
+        list,
+        Pipe.Config("ec-retry-methods"),
+        Pipe.Help("HTTP methods of the requests that can be retried"),
+        Pipe.Notes("default: the idempotent methods " + ", ".join(IDEMPOTENT_METHODS)),
+    ] = IDEMPOTENT_METHODS
 
-    def __enter__(self):
-        self.client = httpx.Client(
-            base_url=self.api_url,
-            headers={
+    def client_kwargs(self) -> dict:
+        """Arguments for creating an HTTP client with the context settings."""
+        return {
+            "base_url": self.api_url,
+            "headers": {
                 "Authorization": f"ApiKey {self.auth_key}",
                 "Content-Type": "application/json",
             },
+        }
+
+    def limits(self) -> httpx.Limits:
+        """Connection pool limits of the context."""
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
         )
+
+    def make_transport(self, cls):
+        """Create a transport of class `cls` with the context settings."""
+        try:
+            return cls(http2=self.http2, limits=self.limits())
+        except ImportError as e:
+            self.logger.error(f"cannot enable HTTP/2: {e}")
+            sys.exit(1)
+
+    def get_cache(self) -> Optional[ResponseCache]:
+        """Get the response cache of the context, if enabled."""
+        if not self.cache:
+            return None
+        with _clients_lock:
+            if self.cache_dir not in _caches:
+                _caches[self.cache_dir] = ResponseCache(self.cache_dir, self.cache_ttl)
+            return _caches[self.cache_dir]
+
+    def get_limiter(self) -> Optional[RateLimiter]:
+        """Get the rate limiter of the API URL, if any.
+
+        Once a pipe sets a rate limit, it applies to all the following pipes
+        of the run using the same API URL. A pipe setting a different rate
+        limit updates the shared one.
+        """
+        with _clients_lock:
+            limiter = _limiters.get(self.api_url)
+            if self.rate_limit is None:
+                return limiter
+            if limiter is None:
+                limiter = _limiters[self.api_url] = RateLimiter(self.rate_limit, self.rate_burst)
+            elif (limiter.rate, limiter.burst) != (self.rate_limit, self.rate_burst):
+                self.logger.debug(f"rate limit of '{self.api_url}' changed to {self.rate_limit}/s, burst {self.rate_burst}")
+                limiter.update(self.rate_limit, self.rate_burst)
+            return limiter
+
+    def transport_kwargs(self) -> dict:
+        """Arguments for wrapping a transport with the context policies."""
+        return {
+            "gzip_min_size": self.gzip_min_size,
+            "cache": self.get_cache(),
+            "limiter": self.get_limiter(),
+            "retry": RetryPolicy(self.retries, self.retry_methods),
+        }
+
+    def __enter__(self):
+        self.span = pipe_span(self.logger.name)
+        self.span.__enter__()
+        key = (self.api_url, self.http2, self.max_connections, self.max_keepalive_connections, self.keepalive_expiry)
+        kwargs = self.transport_kwargs()
+        with _clients_lock:
+            if key not in _pools:
+                _pools[key] = self.make_transport(httpx.HTTPTransport)
+            pool = _pools[key]
+        self.client = httpx.Client(transport=Transport(pool, **kwargs), **self.client_kwargs())
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self.client.close()
+        # the connection pool is shared with the other pipes, it's closed at exit
+        self.span.__exit__(exc_type, exc_value, traceback)
+
+
+class AsyncContext(Context):
+    """Elastic Cloud API context with an additional async HTTP client.
+
+    The async client is bound to the event loop, it's available as `aclient`
+    only within `async with ec:`, see `run`. Requests issued with `request`
+    are bounded by the configured concurrency.
+    """
+
+    concurrency: Annotated[
+        int,
+        Pipe.Config("ec-concurrency"),
+        Pipe.Help("maximum number of concurrent API requests"),
+    ] = 10
+
+    async def __aenter__(self):
+        transport = AsyncTransport(self.make_transport(httpx.AsyncHTTPTransport), **self.transport_kwargs())
+        self.aclient = httpx.AsyncClient(transport=transport, **self.client_kwargs())
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclient.aclose()
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Issue an API request once a concurrency slot is available."""
+        async with self.semaphore:
+            return await self.aclient.request(method, url, **kwargs)
+
+    def run(self, func, *args):
+        """Run the coroutine function `func(*args)` with the async client open.
+
+        Returns:
+            The value returned by the coroutine
+        """
+
+        async def _run():
+            async with self:
+                return await func(*args)
+
+        return asyncio.run(_run())
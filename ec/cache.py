@@ -0,0 +1,133 @@
+# Copyright 2026 Elasticsearch B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Conditional-request cache of the Elastic Cloud API responses."""
+
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+import httpx
+
+# headers not describing the decoded body, dropped from the cached responses
+_HOP_HEADERS = ("content-encoding", "content-length", "transfer-encoding", "connection")
+
+
+class ResponseCache:
+    """Cache of GET responses revalidated with ETag and Last-Modified.
+
+    Entries live in memory for the whole run and, if a directory is given,
+    also on disk across runs. Entries older than `ttl` seconds are evicted.
+    """
+
+    def __init__(self, directory: Optional[str] = None, ttl: float = 3600):
+        self.directory = Path(directory).expanduser() if directory else None
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+        if self.directory:
+            self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+            for path in self.directory.glob("*.json"):
+                if self.expired(path.stat().st_mtime):
+                    _unlink(path)
+
+    def expired(self, stored_at: float) -> bool:
+        return time.time() - stored_at > self.ttl
+
+    def key(self, request: httpx.Request) -> str:
+        # the credentials are part of the key, cached bodies are never shared across accounts
+        auth = request.headers.get("Authorization", "")
+        return hashlib.sha256(f"{auth}\n{request.url}".encode()).hexdigest()
+
+    def load(self, key: str) -> Optional[dict]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None and self.directory:
+                path = self.directory / f"{key}.json"
+                try:
+                    entry = json.loads(path.read_text())
+                except (OSError, ValueError):
+                    entry = None
+            if entry is not None and self.expired(entry["stored_at"]):
+                self.entries.pop(key, None)
+                if self.directory:
+                    _unlink(self.directory / f"{key}.json")
+                entry = None
+            if entry is not None:
+                self.entries[key] = entry
+            return entry
+
+    def store(self, key: str, entry: dict):
+        with self.lock:
+            self.entries[key] = entry
+            if self.directory:
+                path = self.directory / f"{key}.json"
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, "w") as f:
+                    json.dump(entry, f)
+
+    def prepare(self, request: httpx.Request) -> Tuple[Optional[str], Optional[dict]]:
+        """Add the validators of the cached response, if any, to a GET request.
+
+        Returns:
+            The cache key and entry to pass to `complete`
+        """
+        if request.method != "GET":
+            return None, None
+        key = self.key(request)
+        entry = self.load(key)
+        if entry is not None:
+            if entry.get("etag"):
+                request.headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                request.headers["If-Modified-Since"] = entry["last_modified"]
+        return key, entry
+
+    def complete(self, request: httpx.Request, response: httpx.Response, key: Optional[str], entry: Optional[dict]) -> httpx.Response:
+        """Serve 304 responses from the cache, store the cacheable ones.
+
+        The response body must be already read.
+        """
+        if key is None:
+            return response
+
+        if response.status_code == 304 and entry is not None:
+            content = base64.b64decode(entry["content"])
+            return httpx.Response(entry["status_code"], headers=entry["headers"], content=content, request=request)
+
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if response.status_code == 200 and (etag or last_modified):
+            entry = {
+                "status_code": response.status_code,
+                "headers": [(k, v) for k, v in response.headers.multi_items() if k.lower() not in _HOP_HEADERS],
+                "content": base64.b64encode(response.content).decode(),
+                "etag": etag,
+                "last_modified": last_modified,
+                "stored_at": time.time(),
+            }
+            self.store(key, entry)
+        return response
+
+
+def _unlink(path: Path):
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
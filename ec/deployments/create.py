@@ -18,40 +18,199 @@ Create an Elastic Cloud deployment.
 https://www.elastic.co/docs/api/doc/cloud/operation/operation-create-deployment
 """
 
+import asyncio
+import sys
+import time
 from logging import Logger
+from typing import Optional
 
+import httpx
 from elastic.pipes.core import TRACE, Pipe
-from elastic.pipes.ec import Context, handle_response
+from elastic.pipes.ec import (
+    AsyncContext,
+    backoff,
+    get_resources,
+    handle_async_response,
+    handle_response,
+)
 from typing_extensions import Annotated
 
 
+def is_plan_started(info: dict) -> bool:
+    """Check whether any resource of the deployment started applying its plan."""
+    for resource in get_resources(info):
+        plan_info = resource.get("plan_info", {})
+        for plan in (plan_info.get("pending"), plan_info.get("current")):
+            if plan and plan.get("attempt_start_time"):
+                return True
+    return False
+
+
+def is_healthy(info: dict) -> bool:
+    """Check whether all the resources of the deployment are healthy and running."""
+    resources = get_resources(info)
+    return bool(resources) and all(
+        resource.get("healthy") and resource.get("status") == "started" and not resource.get("plan_info", {}).get("pending")
+        for resource in resources
+    )
+
+
+async def wait_healthy(log: Logger, ec: AsyncContext, deployment_id: str, timings: dict, start: float, timeout: float, delays):
+    """Poll the deployment until all its resources are healthy, recording the timings.
+
+    Raises:
+        TimeoutError: If the deployment is not healthy within `timeout` seconds
+    """
+    for delay in delays:
+        await asyncio.sleep(delay)
+        response = await ec.request("GET", f"/deployments/{deployment_id}", params={"show_plans": "true"})
+        info = await handle_async_response(response, log)
+        elapsed = time.monotonic() - start
+
+        if "plan_started" not in timings and is_plan_started(info):
+            timings["plan_started"] = elapsed
+            log.info(f"deployment {deployment_id} plan started after {elapsed:.1f}s")
+        if is_healthy(info):
+            timings.setdefault("plan_started", elapsed)
+            timings["healthy"] = elapsed
+            log.info(f"deployment {deployment_id} healthy after {elapsed:.1f}s")
+            return
+        if elapsed > timeout:
+            raise TimeoutError(f"deployment {deployment_id} not healthy after {elapsed:.1f}s")
+
+
+async def create_deployment(log: Logger, ec: AsyncContext, body: dict, wait: Optional[dict] = None) -> dict:
+    """Create a deployment and optionally wait until it's healthy.
+
+    Failures while waiting are recorded in the "error" field of the result.
+
+    Args:
+        wait: Polling settings ("timeout", "initial", "maximum"), None to not wait
+    """
+    name = body["name"]
+    log.info(f"creating deployment: {name}")
+    log.log(TRACE, f"request body:\n{body}")
+
+    start = time.monotonic()
+    response = await ec.request("POST", "/deployments", json=body)
+    result = await handle_async_response(response, log)
+    log.info(f"deployment created: {name}: {result.get('id')}")
+
+    if wait is not None:
+        result["timings"] = timings = {"accepted": time.monotonic() - start}
+        delays = backoff(wait["initial"], wait["maximum"])
+        try:
+            await wait_healthy(log, ec, result["id"], timings, start, wait["timeout"], delays)
+        except (httpx.HTTPError, TimeoutError) as e:
+            log.error(f"deployment {name} did not become healthy: {e}")
+            result["error"] = str(e)
+
+    return result
+
+
+async def create_deployments(log: Logger, ec: AsyncContext, bodies: list, wait: Optional[dict] = None) -> dict:
+    """Create the deployments concurrently, collecting results and failures by name."""
+
+    async def create(body):
+        try:
+            return body["name"], await create_deployment(log, ec, body, wait)
+        except httpx.HTTPError as e:
+            log.error(f"could not create deployment {body['name']}: {e}")
+            return body["name"], {"error": str(e)}
+
+    return dict(await asyncio.gather(*(create(body) for body in bodies)))
+
+
 @Pipe()
 def main(
     log: Logger,
-    ec: Context,
+    ec: AsyncContext,
     deployment: Annotated[
         dict,
         Pipe.State("deployment", mutable=True),
         Pipe.Help("state node destination to store the deployment info"),
+        Pipe.Notes("in bulk mode, the info of each deployment is stored by name"),
     ],
     name: Annotated[
-        str,
+        Optional[str],
         Pipe.Config("name"),
         Pipe.Help("name of the deployment"),
-    ],
+    ] = None,
     resources: Annotated[
-        dict,
+        Optional[dict],
         Pipe.Config("resources"),
         Pipe.Help("deployment resources configuration"),
-    ],
+    ] = None,
+    deployments: Annotated[
+        Optional[list],
+        Pipe.Config("deployments"),
+        Pipe.Help("list of deployments to create concurrently: \"{ 'name': str, 'resources': dict }\""),
+        Pipe.Notes("either [b]name[/b] and [b]resources[/b] or [b]deployments[/b] may be specified, not both"),
+    ] = None,
+    wait: Annotated[
+        bool,
+        Pipe.Config("wait"),
+        Pipe.Help("wait until all the deployment resources are healthy"),
+        Pipe.Notes("the timings (accepted, plan_started, healthy) are stored in the deployment info"),
+    ] = False,
+    wait_timeout: Annotated[
+        float,
+        Pipe.Config("wait-timeout"),
+        Pipe.Help("seconds to wait for the deployment to become healthy"),
+    ] = 1800,
+    poll_interval: Annotated[
+        float,
+        Pipe.Config("poll-interval"),
+        Pipe.Help("initial polling interval in seconds, doubled at every poll"),
+    ] = 5,
+    max_poll_interval: Annotated[
+        float,
+        Pipe.Config("max-poll-interval"),
+        Pipe.Help("maximum polling interval in seconds"),
+    ] = 30,
 ):
-    """Create an Elastic Cloud deployment."""
+    """Create one or more Elastic Cloud deployments."""
+
+    wait_args = None
+    if wait:
+        wait_args = {"timeout": wait_timeout, "initial": poll_interval, "maximum": max_poll_interval}
+
+    if deployments is not None:
+        if name is not None or resources is not None:
+            log.error("both 'deployments' and 'name' or 'resources' are specified")
+            sys.exit(1)
+        names = [body.get("name") for body in deployments]
+        if None in names or len(set(names)) != len(names):
+            log.error("deployment names must be specified and unique")
+            sys.exit(1)
+
+        results = ec.run(create_deployments, log, ec, deployments, wait_args)
+
+        deployment.clear()
+        deployment.update(results)
+
+        if failed := [key for key, result in results.items() if "error" in result]:
+            log.error(f"could not create {len(failed)} of {len(results)} deployments: {', '.join(failed)}")
+            sys.exit(1)
+        return
+
+    if name is None or resources is None:
+        log.error("either 'deployments' or both 'name' and 'resources' must be specified")
+        sys.exit(1)
 
     body = {
         "name": name,
         "resources": resources,
     }
 
+    if wait:
+        result = ec.run(create_deployment, log, ec, body, wait_args)
+        deployment.clear()
+        deployment.update(result)
+        if "error" in result:
+            sys.exit(1)
+        return
+
     log.info(f"creating deployment: {name}")
     log.log(TRACE, f"request body:\n{body}")
 
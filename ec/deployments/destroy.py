@@ -13,29 +13,219 @@
 # limitations under the License.
 
 """
-Delete an Elastic Cloud deployment.
+Delete one or more Elastic Cloud deployments.
 
 https://www.elastic.co/docs/api/doc/cloud/operation/operation-shutdown-deployment
+https://www.elastic.co/docs/api/doc/cloud/operation/operation-search-deployments
 """
 
+import asyncio
+import sys
+import time
 from logging import Logger
+from typing import Optional
 
+import httpx
 from elastic.pipes.core import Pipe
-from elastic.pipes.ec import Context, handle_response
+from elastic.pipes.ec import (
+    AsyncContext,
+    backoff,
+    get_resources,
+    handle_async_response,
+    handle_response,
+)
 from typing_extensions import Annotated
 
 
+def is_stopped(info: dict) -> bool:
+    """Check whether all the resources of the deployment are stopped."""
+    return all(resource.get("status") == "stopped" for resource in get_resources(info))
+
+
+async def select_deployments(log: Logger, ec: AsyncContext, name_prefix: Optional[str], tags: Optional[dict]) -> list:
+    """Get the IDs of the deployments matching the name prefix and all the tags."""
+    if tags:
+        query = {
+            "bool": {
+                "must": [
+                    {
+                        "nested": {
+                            "path": "metadata.tags",
+                            "query": {
+                                "bool": {
+                                    "must": [
+                                        {"term": {"metadata.tags.key": {"value": key}}},
+                                        {"term": {"metadata.tags.value": {"value": value}}},
+                                    ]
+                                }
+                            },
+                        }
+                    }
+                    for key, value in tags.items()
+                ]
+            }
+        }
+        response = await ec.request("POST", "/deployments/_search", json={"query": query, "size": 10000})
+    else:
+        response = await ec.request("GET", "/deployments")
+    deployments = (await handle_async_response(response, log)).get("deployments", [])
+    return [d["id"] for d in deployments if not name_prefix or d.get("name", "").startswith(name_prefix)]
+
+
+async def wait_stopped(log: Logger, ec: AsyncContext, deployment_id: str, start: float, timeout: float, delays) -> float:
+    """Poll the deployment until all its resources are stopped.
+
+    Returns:
+        The seconds elapsed since `start`
+
+    Raises:
+        TimeoutError: If the deployment is not stopped within `timeout` seconds
+    """
+    for delay in delays:
+        await asyncio.sleep(delay)
+        response = await ec.request("GET", f"/deployments/{deployment_id}")
+        elapsed = time.monotonic() - start
+        if response.status_code == 404 or is_stopped(await handle_async_response(response, log)):
+            log.info(f"deployment stopped: {deployment_id} after {elapsed:.1f}s")
+            return elapsed
+        if elapsed > timeout:
+            raise TimeoutError(f"deployment {deployment_id} not stopped after {elapsed:.1f}s")
+
+
+async def shutdown_deployment(log: Logger, ec: AsyncContext, deployment_id: str, wait: Optional[dict] = None) -> dict:
+    """Shut down a deployment and optionally wait until it's stopped.
+
+    Failures are recorded in the "error" field of the result.
+
+    Args:
+        wait: Polling settings ("timeout", "initial", "maximum"), None to not wait
+    """
+    log.info(f"deleting deployment: {deployment_id}")
+    result = {}
+    start = time.monotonic()
+    try:
+        response = await ec.request("POST", f"/deployments/{deployment_id}/_shutdown")
+        await handle_async_response(response, log)
+        result["accepted"] = time.monotonic() - start
+        log.info(f"deployment deleted: {deployment_id}")
+
+        if wait is not None:
+            delays = backoff(wait["initial"], wait["maximum"])
+            result["stopped"] = await wait_stopped(log, ec, deployment_id, start, wait["timeout"], delays)
+    except (httpx.HTTPError, TimeoutError) as e:
+        log.error(f"could not delete deployment {deployment_id}: {e}")
+        result["error"] = str(e)
+    return result
+
+
+async def shutdown_deployments(log: Logger, ec: AsyncContext, deployment_ids: list, wait: Optional[dict] = None) -> dict:
+    """Shut down the deployments concurrently, collecting the results by ID."""
+    results = await asyncio.gather(*(shutdown_deployment(log, ec, deployment_id, wait) for deployment_id in deployment_ids))
+    return dict(zip(deployment_ids, results))
+
+
+async def main_bulk(log: Logger, ec: AsyncContext, deployment_ids, name_prefix, tags, dry_run: bool, wait: Optional[dict]) -> dict:
+    """Select the deployments and shut them down concurrently."""
+    deployment_ids = list(deployment_ids or [])
+    if name_prefix or tags:
+        log.info("selecting deployments")
+        selected = await select_deployments(log, ec, name_prefix, tags)
+        deployment_ids += [deployment_id for deployment_id in selected if deployment_id not in deployment_ids]
+    log.info(f"deployments to delete: {', '.join(deployment_ids) or 'none'}")
+    if dry_run:
+        return {}
+    return await shutdown_deployments(log, ec, deployment_ids, wait)
+
+
 @Pipe()
 def main(
+    dry_run: bool,
     log: Logger,
-    ec: Context,
+    ec: AsyncContext,
     deployment_id: Annotated[
-        str,
+        Optional[str],
         Pipe.Config("deployment-id"),
         Pipe.Help("identifier of the deployment to delete"),
-    ],
+    ] = None,
+    deployment_ids: Annotated[
+        Optional[list],
+        Pipe.Config("deployment-ids"),
+        Pipe.Help("identifiers of the deployments to delete concurrently"),
+    ] = None,
+    name_prefix: Annotated[
+        Optional[str],
+        Pipe.Config("name-prefix"),
+        Pipe.Help("delete the deployments whose name starts with this prefix"),
+    ] = None,
+    tags: Annotated[
+        Optional[dict],
+        Pipe.Config("tags"),
+        Pipe.Help("delete the deployments having all these tags (key: value)"),
+        Pipe.Notes("selectors are combined, selected deployments are added to [b]deployment-ids[/b]"),
+    ] = None,
+    results: Annotated[
+        Optional[dict],
+        Pipe.State("deployments", mutable=True),
+        Pipe.Help("state node destination of the per-deployment results"),
+    ] = None,
+    wait: Annotated[
+        bool,
+        Pipe.Config("wait"),
+        Pipe.Help("wait until all the deployment resources are stopped"),
+    ] = False,
+    wait_timeout: Annotated[
+        float,
+        Pipe.Config("wait-timeout"),
+        Pipe.Help("seconds to wait for the deployment to stop"),
+    ] = 1800,
+    poll_interval: Annotated[
+        float,
+        Pipe.Config("poll-interval"),
+        Pipe.Help("initial polling interval in seconds, doubled at every poll"),
+    ] = 5,
+    max_poll_interval: Annotated[
+        float,
+        Pipe.Config("max-poll-interval"),
+        Pipe.Help("maximum polling interval in seconds"),
+    ] = 30,
 ):
-    """Delete an Elastic Cloud deployment."""
+    """Delete one or more Elastic Cloud deployments."""
+
+    wait_args = None
+    if wait:
+        wait_args = {"timeout": wait_timeout, "initial": poll_interval, "maximum": max_poll_interval}
+
+    if deployment_id is None:
+        if deployment_ids is None and not name_prefix and not tags:
+            log.error("either 'deployment-id', 'deployment-ids', 'name-prefix' or 'tags' must be specified")
+            sys.exit(1)
+
+        outcome = ec.run(main_bulk, log, ec, deployment_ids, name_prefix, tags, dry_run, wait_args)
+
+        if results is not None:
+            results.clear()
+            results.update(outcome)
+
+        if failed := [key for key, result in outcome.items() if "error" in result]:
+            log.error(f"could not delete {len(failed)} of {len(outcome)} deployments: {', '.join(failed)}")
+            sys.exit(1)
+        return
+
+    if deployment_ids is not None or name_prefix or tags:
+        log.error("both 'deployment-id' and 'deployment-ids', 'name-prefix' or 'tags' are specified")
+        sys.exit(1)
+
+    if dry_run:
+        return
+
+    if wait:
+        outcome = ec.run(shutdown_deployment, log, ec, deployment_id, wait_args)
+        if results is not None:
+            results.clear()
+            results[deployment_id] = outcome
+        if "error" in outcome:
+            sys.exit(1)
+        return
 
     log.info(f"deleting deployment: {deployment_id}")
     response = ec.client.post(f"/deployments/{deployment_id}/_shutdown")
@@ -13,40 +13,94 @@
 # limitations under the License.
 
 """
-Get the Elasticsearch resource keystore.
+Get the Elasticsearch resource keystore, of one or more deployments.
 
 https://www.elastic.co/docs/api/doc/cloud/operation/operation-get-deployment-es-resource-keystore
 """
 
+import asyncio
+import sys
 from logging import Logger
+from typing import Optional
 
+import httpx
 from elastic.pipes.core import Pipe
-from elastic.pipes.ec import Context, handle_response
+from elastic.pipes.ec import AsyncContext, handle_async_response, handle_response
 from typing_extensions import Annotated
 
 
+async def get_keystores(log: Logger, ec: AsyncContext, deployment_ids: list, ref_ids: list) -> dict:
+    """Get the keystores concurrently, collecting contents and failures by deployment and ref_id."""
+
+    async def get(deployment_id, ref_id):
+        try:
+            response = await ec.request("GET", f"/deployments/{deployment_id}/elasticsearch/{ref_id}/keystore")
+            return await handle_async_response(response, log)
+        except httpx.HTTPError as e:
+            log.error(f"could not get keystore for deployment {deployment_id}, ref_id {ref_id}: {e}")
+            return {"error": str(e)}
+
+    targets = [(deployment_id, ref_id) for deployment_id in deployment_ids for ref_id in ref_ids]
+    log.info(f"getting keystore for {len(deployment_ids)} deployments, ref_ids {', '.join(ref_ids)}")
+    results = await asyncio.gather(*(get(*target) for target in targets))
+
+    keystores = {}
+    for (deployment_id, ref_id), result in zip(targets, results):
+        keystores.setdefault(deployment_id, {})[ref_id] = result
+    return keystores
+
+
 @Pipe()
 def main(
     log: Logger,
-    ec: Context,
-    deployment_id: Annotated[
-        str,
-        Pipe.Config("deployment-id"),
-        Pipe.Help("identifier of the deployment"),
-    ],
+    ec: AsyncContext,
     keystore: Annotated[
         dict,
         Pipe.State("keystore", mutable=True),
         Pipe.Help("state node destination to store the keystore contents"),
+        Pipe.Notes("with [b]deployment-ids[/b], the contents are stored by deployment and ref_id"),
     ],
+    deployment_id: Annotated[
+        Optional[str],
+        Pipe.Config("deployment-id"),
+        Pipe.Help("identifier of the deployment"),
+    ] = None,
     ref_id: Annotated[
         str,
         Pipe.Config("ref-id"),
         Pipe.Help("Elasticsearch resource identifier"),
     ] = "_main",
+    deployment_ids: Annotated[
+        Optional[list],
+        Pipe.Config("deployment-ids"),
+        Pipe.Help("identifiers of the deployments to get the keystore of, concurrently"),
+        Pipe.Notes("either [b]deployment-id[/b] or [b]deployment-ids[/b] may be specified, not both"),
+    ] = None,
+    ref_ids: Annotated[
+        Optional[list],
+        Pipe.Config("ref-ids"),
+        Pipe.Help("Elasticsearch resource identifiers, of each of the [b]deployment-ids[/b]"),
+        Pipe.Notes("default: [b]ref-id[/b]"),
+    ] = None,
 ):
     """Get the Elasticsearch resource keystore."""
 
+    if (deployment_id is None) == (deployment_ids is None):
+        log.error("either 'deployment-id' or 'deployment-ids' must be specified")
+        sys.exit(1)
+
+    if deployment_ids is not None:
+        keystores = ec.run(get_keystores, log, ec, deployment_ids, ref_ids or [ref_id])
+
+        keystore.clear()
+        keystore.update(keystores)
+
+        failed = [f"{d}/{r}" for d, results in keystores.items() for r, result in results.items() if "error" in result]
+        if failed:
+            log.error(f"could not get {len(failed)} keystores: {', '.join(failed)}")
+            sys.exit(1)
+        return
+
     log.info(f"getting keystore for deployment {deployment_id}, ref_id {ref_id}")
     response = ec.client.get(f"/deployments/{deployment_id}/elasticsearch/{ref_id}/keystore")
     result = handle_response(response, log)
@@ -13,47 +13,208 @@
 # limitations under the License.
 
 """
-Add, update or remove items from the Elasticsearch resource keystore.
+Add, update or remove items from the Elasticsearch resource keystore, of one
+or more deployments.
+
+The keystore API does not disclose the secret values, changes are detected
+by comparing the secrets with the digests of those last written by this pipe.
 
 https://www.elastic.co/docs/api/doc/cloud/operation/operation-set-deployment-es-resource-keystore
 """
 
+import asyncio
+import hashlib
+import hmac
+import json
+import sys
 from logging import Logger
+from typing import Optional
 
+import httpx
 from elastic.pipes.core import Pipe
-from elastic.pipes.ec import Context, handle_response
+from elastic.pipes.ec import AsyncContext, handle_async_response, handle_response
 from typing_extensions import Annotated
 
 
+def digest_secret(key: str, secret: dict) -> str:
+    """Keyed digest of a secret, safe to store along with the pipeline state."""
+    msg = json.dumps(secret, sort_keys=True).encode()
+    return hmac.new(key.encode(), msg, hashlib.sha256).hexdigest()
+
+
+def diff_secrets(current: Optional[dict], secrets: dict, digests: dict, key: str) -> dict:
+    """Compare the secrets to apply with the current keystore contents.
+
+    Args:
+        current: The secrets in the keystore, as returned by the API, None if unknown
+        secrets: The secrets to apply, null values are to be removed
+        digests: The digests of the secrets last written
+        key: The digest key
+
+    Returns:
+        The names of the secrets "added", "changed", "removed" and "unchanged"
+    """
+    diff = {"added": [], "changed": [], "removed": [], "unchanged": []}
+    for name, secret in secrets.items():
+        if current is None:
+            diff["changed" if secret is not None else "removed"].append(name)
+        elif secret is None:
+            diff["removed" if name in current else "unchanged"].append(name)
+        elif name not in current:
+            diff["added"].append(name)
+        elif bool(secret.get("as_file")) != bool(current[name].get("as_file")) or digests.get(name) != digest_secret(key, secret):
+            diff["changed"].append(name)
+        else:
+            diff["unchanged"].append(name)
+    return diff
+
+
+def select_changes(secrets: dict, diff: dict) -> dict:
+    """Select the secrets added, changed or removed."""
+    return {name: secrets[name] for name in diff["added"] + diff["changed"] + diff["removed"]}
+
+
+def record_digests(digests: dict, changes: dict, key: str):
+    """Record the digests of the secrets written, forget those removed."""
+    for name, secret in changes.items():
+        if secret is None:
+            digests.pop(name, None)
+        else:
+            digests[name] = digest_secret(key, secret)
+
+
+async def update_keystore(log: Logger, ec: AsyncContext, deployment_id: str, ref_id: str, secrets: dict, diff: bool, digests: dict) -> dict:
+    """Update a keystore, failures are recorded in the "error" field of the result."""
+    path = f"/deployments/{deployment_id}/elasticsearch/{ref_id}/keystore"
+    try:
+        current = None
+        # without digests every existing secret counts as changed, the keystore is not worth getting
+        if diff and digests:
+            current = (await handle_async_response(await ec.request("GET", path), log)).get("secrets", {})
+        report = diff_secrets(current, secrets, digests, ec.auth_key)
+        changes = select_changes(secrets, report)
+        if changes:
+            await handle_async_response(await ec.request("PATCH", path, json={"secrets": changes}), log)
+            log.info(f"keystore updated for deployment {deployment_id}, ref_id {ref_id}")
+        else:
+            log.info(f"keystore unchanged for deployment {deployment_id}, ref_id {ref_id}")
+    except httpx.HTTPError as e:
+        log.error(f"could not update keystore for deployment {deployment_id}, ref_id {ref_id}: {e}")
+        return {"error": str(e)}
+    record_digests(digests, changes, ec.auth_key)
+    return report
+
+
+async def update_keystores(
+    log: Logger, ec: AsyncContext, deployment_ids: list, ref_ids: list, secrets: dict, diff: bool, digests: dict
+) -> dict:
+    """Update the keystores concurrently, collecting reports and failures by deployment and ref_id."""
+    targets = [(deployment_id, ref_id) for deployment_id in deployment_ids for ref_id in ref_ids]
+    log.info(f"updating keystore for {len(deployment_ids)} deployments, ref_ids {', '.join(ref_ids)}")
+    results = await asyncio.gather(*(update_keystore(log, ec, d, r, secrets, diff, digests.setdefault(f"{d}/{r}", {})) for d, r in targets))
+
+    reports = {}
+    for (deployment_id, ref_id), result in zip(targets, results):
+        reports.setdefault(deployment_id, {})[ref_id] = result
+    return reports
+
+
 @Pipe()
 def main(
     log: Logger,
-    ec: Context,
-    deployment_id: Annotated[
-        str,
-        Pipe.Config("deployment-id"),
-        Pipe.Help("identifier of the deployment"),
-    ],
+    ec: AsyncContext,
     secrets: Annotated[
         dict,
         Pipe.Config("secrets"),
         Pipe.Help("map of the secrets: \"{ 'value': str|object, 'as_file': bool }\""),
         Pipe.Notes("secrets with a null value are removed from the keystore, those unspecified are preserved"),
     ],
+    deployment_id: Annotated[
+        Optional[str],
+        Pipe.Config("deployment-id"),
+        Pipe.Help("identifier of the deployment"),
+    ] = None,
     ref_id: Annotated[
         str,
         Pipe.Config("ref-id"),
         Pipe.Help("Elasticsearch resource identifier"),
     ] = "_main",
+    deployment_ids: Annotated[
+        Optional[list],
+        Pipe.Config("deployment-ids"),
+        Pipe.Help("identifiers of the deployments to update the keystore of, concurrently"),
+        Pipe.Notes("either [b]deployment-id[/b] or [b]deployment-ids[/b] may be specified, not both"),
+    ] = None,
+    ref_ids: Annotated[
+        Optional[list],
+        Pipe.Config("ref-ids"),
+        Pipe.Help("Elasticsearch resource identifiers, of each of the [b]deployment-ids[/b]"),
+        Pipe.Notes("default: [b]ref-id[/b]"),
+    ] = None,
+    diff: Annotated[
+        bool,
+        Pipe.Config("diff"),
+        Pipe.Help("send only the secrets added, changed or removed, skip the update if none"),
+        Pipe.Notes(
+            "changes are detected only against the digests in [b]keystore-update[/b], which must be bound and persisted "
+            "across runs; without them the keystore is not read and all the secrets are sent"
+        ),
+    ] = True,
+    update: Annotated[
+        Optional[dict],
+        Pipe.State("keystore-update", mutable=True),
+        Pipe.Help("state node destination of the names of the secrets sent and their digests"),
+        Pipe.Notes("preserve the digests across runs to skip the secrets already written"),
+    ] = None,
 ):
     """Add, update or remove items from the Elasticsearch resource keystore."""
 
-    body = {"secrets": secrets}
+    if (deployment_id is None) == (deployment_ids is None):
+        log.error("either 'deployment-id' or 'deployment-ids' must be specified")
+        sys.exit(1)
+
+    all_digests = (update or {}).get("digests", {})
+
+    if deployment_ids is not None:
+        reports = ec.run(update_keystores, log, ec, deployment_ids, ref_ids or [ref_id], secrets, diff, all_digests)
+
+        if update is not None:
+            update.clear()
+            update["deployments"] = reports
+            update["digests"] = all_digests
+
+        failed = [f"{d}/{r}" for d, results in reports.items() for r, result in results.items() if "error" in result]
+        if failed:
+            log.error(f"could not update {len(failed)} keystores: {', '.join(failed)}")
+            sys.exit(1)
+        return
+
+    path = f"/deployments/{deployment_id}/elasticsearch/{ref_id}/keystore"
+    digests = all_digests.setdefault(f"{deployment_id}/{ref_id}", {})
+
+    current = None
+    if diff and digests:
+        log.info(f"getting keystore for deployment {deployment_id}, ref_id {ref_id}")
+        current = handle_response(ec.client.get(path), log).get("secrets", {})
+    report = diff_secrets(current, secrets, digests, ec.auth_key)
+    secrets = select_changes(secrets, report)
+
+    if secrets:
+        body = {"secrets": secrets}
+
+        log.info(f"updating keystore for deployment {deployment_id}, ref_id {ref_id}")
+        response = ec.client.patch(path, json=body)
+        handle_response(response, log)
+        log.info(f"keystore updated for deployment {deployment_id}, ref_id {ref_id}")
+    else:
+        log.info(f"keystore unchanged for deployment {deployment_id}, ref_id {ref_id}")
+
+    record_digests(digests, secrets, ec.auth_key)
 
-    log.info(f"updating keystore for deployment {deployment_id}, ref_id {ref_id}")
-    response = ec.client.patch(f"/deployments/{deployment_id}/elasticsearch/{ref_id}/keystore", json=body)
-    handle_response(response, log)
-    log.info(f"keystore updated for deployment {deployment_id}, ref_id {ref_id}")
+    if update is not None:
+        update.clear()
+        update.update(report)
+        update["digests"] = all_digests
 
 
 if __name__ == "__main__":
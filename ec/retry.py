@@ -0,0 +1,100 @@
+# Copyright 2026 Elasticsearch B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Rate limiting and retries of the Elastic Cloud API requests."""
+
+import email.utils
+import random
+import threading
+import time
+from typing import Optional
+
+import httpx
+
+IDEMPOTENT_METHODS = ["GET", "HEAD", "OPTIONS", "PUT", "DELETE"]
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+
+
+class RateLimiter:
+    """Token bucket limiting the request rate, safe to share across threads and event loops."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def update(self, rate: float, burst: int):
+        """Change the rate and the burst, keeping the tokens available."""
+        with self.lock:
+            self.rate = rate
+            self.burst = burst
+            self.tokens = min(self.tokens, float(burst))
+
+    def reserve(self) -> float:
+        """Take a token from the bucket.
+
+        Returns:
+            The seconds to wait before the token can be used
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+
+def parse_retry_after(response: httpx.Response) -> Optional[float]:
+    """Get the seconds to wait as requested by the Retry-After header, if any."""
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """Retries with jittered exponential backoff, honoring Retry-After.
+
+    Only the requests with one of the given methods are retried, on
+    transport errors and on the 429, 502, 503 and 504 responses.
+    """
+
+    def __init__(self, retries: int, methods: list, initial: float = 0.5, maximum: float = 30.0):
+        self.retries = retries
+        self.methods = {method.upper() for method in methods}
+        self.initial = initial
+        self.maximum = maximum
+
+    def retryable(self, request: httpx.Request, attempt: int) -> bool:
+        """Check whether the request can be attempted once more."""
+        return attempt < self.retries and request.method in self.methods
+
+    def should_retry(self, response: httpx.Response) -> bool:
+        return response.status_code in RETRY_STATUS_CODES
+
+    def delay(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """Seconds to wait before the next attempt, at least those asked by the server."""
+        delay = random.uniform(0, min(self.maximum, self.initial * 2**attempt))
+        if response is not None and (retry_after := parse_retry_after(response)) is not None:
+            delay = max(delay, retry_after)
+        return delay
@@ -12,24 +12,51 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import sys
+import time
+from datetime import datetime
 from logging import Logger
+from pathlib import Path
+from typing import Optional
 
+import httpx
+import hvac
+import requests
 from elastic.pipes.core import Pipe
-from elastic.pipes.ec import Context, handle_response
+from elastic.pipes.ec import AsyncContext, handle_async_response, handle_response
+from elastic.pipes.es.snapshot import parse_duration
 from typing_extensions import Annotated
 
 
 class Ctx(Pipe.Context):
     key: Annotated[
-        dict,
+        Optional[dict],
         Pipe.State("key", mutable=True),
         Pipe.Help("state node destination for the created API key"),
-    ]
+    ] = None
+    keys: Annotated[
+        Optional[dict],
+        Pipe.State("keys", mutable=True),
+        Pipe.Help("state node destination for the created API keys, by description"),
+    ] = None
     description: Annotated[
         str,
         Pipe.Config("description"),
         Pipe.Help("description of the API key"),
-    ]
+    ] = None
+    descriptions: Annotated[
+        list,
+        Pipe.Config("descriptions"),
+        Pipe.Help(
+            "API keys to create concurrently: description or \"{ 'description': str, 'expiration': str, 'role_assignments': dict }\""
+        ),
+        Pipe.Notes("either [b]description[/b] or [b]descriptions[/b] may be specified, not both"),
+    ] = None
     expiration: Annotated[
         str,
         Pipe.Config("expiration"),
@@ -40,29 +67,272 @@ class Ctx(Pipe.Context):
         Pipe.Config("role-assignments"),
         Pipe.Help("role assignments (platform, organization, deployment, project)"),
     ] = None
+    cache_file: Annotated[
+        str,
+        Pipe.Config("cache-file"),
+        Pipe.Help("encrypted file where to cache the created API keys for reuse"),
+        Pipe.Notes("requires the 'key-cache' extra (cryptography package)"),
+    ] = None
+    cache_vault_path: Annotated[
+        str,
+        Pipe.Config("cache-vault-path"),
+        Pipe.Help("Vault path where to cache the created API keys for reuse"),
+    ] = None
+    cache_vault_url: Annotated[
+        str,
+        Pipe.Config("cache-vault-url"),
+        Pipe.Help("URL of the Vault instance of [b]cache-vault-path[/b]"),
+        Pipe.Notes("default: from environment VAULT_ADDR"),
+    ] = None
+    cache_vault_token_file: Annotated[
+        str,
+        Pipe.Config("cache-vault-token-file"),
+        Pipe.Help("file containing the Vault token for [b]cache-vault-path[/b]"),
+        Pipe.Notes("default: token from environment VAULT_TOKEN"),
+    ] = None
+    min_lifetime: Annotated[
+        str,
+        Pipe.Config("min-lifetime"),
+        Pipe.Help("minimum lifetime left for a cached API key to be reused (ex. '30m', '1h')"),
+    ] = "10m"
+    reuse_tolerance: Annotated[
+        str,
+        Pipe.Config("reuse-tolerance"),
+        Pipe.Help("lifetime a cached API key may have lost, compared to the requested [b]expiration[/b], to be reused"),
+        Pipe.Notes("a key requested with expiration '30d' is reused if it has at least 30 days minus the tolerance left"),
+    ] = "1h"
+
+    def make_body(self, spec) -> dict:
+        """Request body of a key, the settings of the context are the defaults."""
+        if isinstance(spec, str):
+            spec = {"description": spec}
+        body = {
+            "description": spec["description"],
+        }
+
+        if expiration := spec.get("expiration", self.expiration):
+            body["expiration"] = expiration
+
+        if role_assignments := spec.get("role_assignments", self.role_assignments):
+            body["role_assignments"] = role_assignments
+
+        return body
+
+
+def get_expiration(key: dict, body: dict) -> Optional[float]:
+    """Get the expiration time of a newly created key, None if it does not expire."""
+    if expiration_date := key.get("expiration_date"):
+        return datetime.fromisoformat(expiration_date.replace("Z", "+00:00")).timestamp()
+    if expiration := body.get("expiration"):
+        return time.time() + parse_duration(expiration)
+    return None
+
+
+class KeyCache:
+    """Cache of the created API keys, in an encrypted file or in Vault.
+
+    Keys are looked up by a hash of the API URL and key, description and
+    role assignments. The file is encrypted with a key derived from the
+    Elastic Cloud API key, changing it invalidates the cache.
+    """
+
+    def __init__(
+        self,
+        log: Logger,
+        ec: AsyncContext,
+        file: Optional[str],
+        vault_path: Optional[str],
+        vault_url: Optional[str] = None,
+        vault_token_file: Optional[str] = None,
+    ):
+        self.log = log
+        self.ec = ec
+        self.file = Path(file).expanduser() if file else None
+        self.vault_path = vault_path
+        self.vault_url = vault_url
+        self.vault_token_file = vault_token_file
+        self.entries = {}
+        self.dirty = False
+
+    def fernet(self):
+        from cryptography.fernet import Fernet
+
+        secret = hashlib.sha256(f"elastic-pipes api key cache\n{self.ec.auth_key}".encode()).digest()
+        return Fernet(base64.urlsafe_b64encode(secret))
+
+    def vault(self):
+        from elastic.pipes.hcp.vault.common import get_client, resolve_credentials
+
+        url, token = resolve_credentials(self.log, self.vault_url, token_file=self.vault_token_file)
+        return get_client(self.log, url, token)
+
+    def load(self):
+        if self.file:
+            from cryptography.fernet import InvalidToken
+
+            if self.file.exists():
+                try:
+                    self.entries = json.loads(self.fernet().decrypt(self.file.read_bytes()))
+                except InvalidToken:
+                    self.entries = {}
+        else:
+            res = self.vault().read(self.vault_path)
+            data = (res or {}).get("data", {})
+            if "/data/" in self.vault_path:
+                data = data.get("data") or {}
+            self.entries = json.loads(data.get("keys", "{}"))
+
+    def save(self):
+        if not self.dirty:
+            return
+        now = time.time()
+        self.entries = {k: v for k, v in self.entries.items() if v["expires_at"] is None or v["expires_at"] > now}
+        if self.file:
+            self.file.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(self.file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.fernet().encrypt(json.dumps(self.entries).encode()))
+        else:
+            data = {"keys": json.dumps(self.entries)}
+            if "/data/" in self.vault_path:
+                data = {"data": data}
+            self.vault().write_data(self.vault_path, data=data)
+
+    def cache_key(self, body: dict) -> str:
+        spec = [self.ec.api_url, self.ec.auth_key, body["description"], body.get("expiration"), body.get("role_assignments")]
+        return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+    def lookup(self, body: dict, min_lifetime: int, tolerance: int) -> Optional[dict]:
+        """Get a cached key with at least `min_lifetime` seconds left and at most `tolerance` less than requested."""
+        entry = self.entries.get(self.cache_key(body))
+        if not entry:
+            return None
+        if entry["expires_at"] is None:
+            return entry["key"]
+        required = min_lifetime
+        if expiration := body.get("expiration"):
+            required = max(required, parse_duration(expiration) - tolerance)
+        if entry["expires_at"] - time.time() >= required:
+            return entry["key"]
+        return None
+
+    def forget(self, body: dict):
+        self.entries.pop(self.cache_key(body), None)
+        self.dirty = True
+
+    def store(self, body: dict, key: dict):
+        self.entries[self.cache_key(body)] = {"key": key, "expires_at": get_expiration(key, body)}
+        self.dirty = True
+
+
+def reuse_keys(log: Logger, ec: AsyncContext, cache: KeyCache, bodies: list, min_lifetime: int, tolerance: int) -> dict:
+    """Get the cached keys still existing and with enough lifetime left, by description."""
+    reused = {}
+    for body in bodies:
+        if key := cache.lookup(body, min_lifetime, tolerance):
+            reused[body["description"]] = key
+    if reused:
+        existing = {key["id"] for key in handle_response(ec.client.get("/users/auth/keys"), log).get("keys", [])}
+        for body in bodies:
+            key = reused.get(body["description"])
+            if key and key.get("id") not in existing:
+                log.info(f"cached API key '{body['description']}' does not exist anymore")
+                cache.forget(body)
+                del reused[body["description"]]
+    for description in reused:
+        log.info(f"reusing API key '{description}'")
+    return reused
+
+
+async def create_keys(log: Logger, ec: AsyncContext, bodies: list) -> dict:
+    """Create the API keys concurrently, collecting keys and failures by description."""
+
+    async def create(body):
+        description = body["description"]
+        log.info(f"creating API key '{description}'")
+        try:
+            response = await ec.request("POST", "/users/auth/keys", json=body)
+            return description, await handle_async_response(response, log)
+        except httpx.HTTPError as e:
+            log.error(f"could not create API key '{description}': {e}")
+            return description, {"error": str(e)}
+
+    return dict(await asyncio.gather(*(create(body) for body in bodies)))
 
 
 @Pipe()
 def main(
     log: Logger,
-    ec: Context,
+    ec: AsyncContext,
     ctx: Ctx,
 ):
-    """Create an Elastic Cloud API key."""
+    """Create one or more Elastic Cloud API keys."""
+
+    if (ctx.description is None) == (ctx.descriptions is None):
+        log.error("either 'description' or 'descriptions' must be specified")
+        sys.exit(1)
+
+    if ctx.cache_file and ctx.cache_vault_path:
+        log.error("both 'cache-file' and 'cache-vault-path' are specified")
+        sys.exit(1)
+
+    cache = None
+    cache_error = None
+    if ctx.cache_file or ctx.cache_vault_path:
+        cache = KeyCache(log, ec, ctx.cache_file, ctx.cache_vault_path, ctx.cache_vault_url, ctx.cache_vault_token_file)
+        try:
+            cache.load()
+        except (ImportError, hvac.exceptions.VaultError, requests.RequestException) as e:
+            log.error(f"cannot use the API key cache: {e}")
+            sys.exit(1)
+
+    specs = ctx.descriptions if ctx.descriptions is not None else [ctx.description]
+    bodies = [ctx.make_body(spec) for spec in specs]
+    descriptions = [body["description"] for body in bodies]
+    if len(set(descriptions)) != len(descriptions):
+        log.error("API key descriptions must be unique")
+        sys.exit(1)
+
+    reused = {}
+    if cache is not None:
+        reused = reuse_keys(log, ec, cache, bodies, parse_duration(ctx.min_lifetime), parse_duration(ctx.reuse_tolerance))
+        bodies = [body for body in bodies if body["description"] not in reused]
+
+    if ctx.descriptions is not None:
+        keys = ec.run(create_keys, log, ec, bodies) if bodies else {}
+    elif bodies:
+        log.info(f"creating API key '{ctx.description}'")
+        response = ec.client.post("/users/auth/keys", json=bodies[0])
+        keys = {ctx.description: handle_response(response, log)}
+    else:
+        keys = {}
+
+    if cache is not None:
+        for body in bodies:
+            if "error" not in keys[body["description"]]:
+                cache.store(body, keys[body["description"]])
+        try:
+            cache.save()
+        except (hvac.exceptions.VaultError, requests.RequestException) as e:
+            # the keys are created, store them before failing
+            cache_error = e
 
-    body = {
-        "description": ctx.description,
-    }
+    keys.update(reused)
+    if ctx.descriptions is None:
+        ctx.key = keys[ctx.description]
+    else:
+        ctx.keys = {description: keys[description] for description in descriptions}
 
-    if ctx.expiration:
-        body["expiration"] = ctx.expiration
+    if cache_error is not None:
+        log.error(f"could not save the API key cache: {cache_error}")
+        sys.exit(1)
 
-    if ctx.role_assignments:
-        body["role_assignments"] = ctx.role_assignments
+    if ctx.descriptions is None:
+        return
 
-    log.info(f"creating API key '{ctx.description}'")
-    response = ec.client.post("/users/auth/keys", json=body)
-    ctx.key = handle_response(response, log)
+    if failed := [key for key, result in ctx.keys.items() if "error" in result]:
+        log.error(f"could not create {len(failed)} of {len(descriptions)} API keys: {', '.join(failed)}")
+        sys.exit(1)
 
 
 if __name__ == "__main__":
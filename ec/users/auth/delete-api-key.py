@@ -12,19 +12,39 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import sys
 from logging import Logger
+from typing import Optional, Union
 
 from elastic.pipes.core import Pipe
+from elastic.pipes.core.util import batched
 from elastic.pipes.ec import Context, handle_response
 from typing_extensions import Annotated
 
 
 class Ctx(Pipe.Context):
     key: Annotated[
-        str,
+        Optional[str],
         Pipe.State("key"),
         Pipe.Help("ID of the API key to delete"),
-    ]
+    ] = None
+    keys: Annotated[
+        Union[list, dict, None],
+        Pipe.State("keys"),
+        Pipe.Help("IDs of the API keys to delete, or the API keys as created in bulk"),
+        Pipe.Notes("either [b]key[/b] or [b]keys[/b] may be specified, not both"),
+    ] = None
+    chunk_size: Annotated[
+        int,
+        Pipe.Config("chunk-size"),
+        Pipe.Help("maximum number of API keys deleted per request"),
+    ] = 100
+
+    def key_ids(self) -> list:
+        if self.key is not None:
+            return [self.key]
+        keys = self.keys.values() if isinstance(self.keys, dict) else self.keys
+        return [key["id"] if isinstance(key, dict) else key for key in keys if not isinstance(key, dict) or "id" in key]
 
 
 @Pipe()
@@ -33,15 +53,20 @@ def main(
     ec: Context,
     ctx: Ctx,
 ):
-    """Delete an Elastic Cloud API key."""
+    """Delete one or more Elastic Cloud API keys."""
+
+    if (ctx.key is None) == (ctx.keys is None):
+        log.error("either 'key' or 'keys' must be specified")
+        sys.exit(1)
 
-    body = {
-        "keys": [ctx.key],
-    }
+    for chunk in batched(ctx.key_ids(), ctx.chunk_size):
+        body = {
+            "keys": list(chunk),
+        }
 
-    log.info(f"deleting API key '{ctx.key}'")
-    response = ec.client.request("DELETE", "/users/auth/keys", json=body)
-    handle_response(response, log)
+        log.info(f"deleting API keys: {', '.join(repr(key) for key in chunk)}")
+        response = ec.client.request("DELETE", "/users/auth/keys", json=body)
+        handle_response(response, log)
 
 
 if __name__ == "__main__":
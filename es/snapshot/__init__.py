@@ -0,0 +1,50 @@
+# Copyright 2026 Elasticsearch B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Helpers shared by the snapshot pipes."""
+
+import re
+import urllib.parse
+
+# longest URL-encoded, comma-separated list of names sent in a request URL
+MAX_LIST_LENGTH = 3072
+
+
+def parse_duration(duration: str) -> int:
+    """Convert a duration (ex. '1d', '3h') to seconds."""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+    if not (match := re.fullmatch(r"(\d+)([smhdw])", duration.strip())):
+        raise ValueError(f"invalid duration: '{duration}'")
+    return int(match.group(1)) * units[match.group(2)]
+
+
+def url_length(name: str) -> int:
+    """Length of a name in a URL-encoded, comma-separated list, separator included."""
+    return len(urllib.parse.quote(name, ",*")) + 1
+
+
+def batched_by_length(names, max_length):
+    """Batch the names so that each comma-separated batch, URL-encoded, fits in `max_length`."""
+    batch = []
+    length = 0
+    for name in names:
+        size = url_length(name)
+        if batch and length + size > max_length:
+            yield batch
+            batch = []
+            length = 0
+        batch.append(name)
+        length += size
+    if batch:
+        yield batch
@@ -0,0 +1,170 @@
+# Copyright 2026 Elasticsearch B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import time
+from logging import Logger
+from typing import Optional
+
+from elastic.pipes.core import Pipe
+from elastic.pipes.core.util import get_es_client
+from elastic.pipes.es.snapshot import MAX_LIST_LENGTH, batched_by_length, parse_duration
+from elastic.pipes.telemetry import instrument_es
+from typing_extensions import Annotated
+
+
+def get_snapshots(es, repository, pattern, page_size=500):
+    """Get the snapshots of the repository matching `pattern`, newest first.
+
+    Snapshots are requested one page at a time, without the index lists.
+    """
+    kwargs = {
+        "repository": repository,
+        "snapshot": pattern,
+        "sort": "start_time",
+        "order": "desc",
+        "size": page_size,
+        "index_names": False,
+        "filter_path": ["snapshots.snapshot", "snapshots.state", "snapshots.start_time_in_millis", "next"],
+    }
+    while True:
+        res = es.snapshot.get(**kwargs)
+        yield from res.get("snapshots", [])
+        if not res.get("next"):
+            return
+        kwargs["after"] = res["next"]
+
+
+def select_snapshots(snapshots, keep_last: Optional[int], older_than: Optional[int], now: float) -> list:
+    """Select the snapshots to delete.
+
+    The `keep_last` newest successful snapshots are kept, along with the
+    failed and partial ones newer than the oldest of them. Of the others
+    only those started more than `older_than` seconds ago are selected.
+    Snapshots in progress are never selected.
+
+    Args:
+        snapshots: The snapshots, newest first
+        keep_last: Number of successful snapshots to keep, None to keep none by count
+        older_than: Minimum age in seconds, None to select by count only
+        now: Current time in seconds since the epoch
+    """
+    selected = []
+    successful = 0
+    for snapshot in snapshots:
+        if snapshot["state"] == "IN_PROGRESS":
+            continue
+        if keep_last is not None and successful < keep_last:
+            # failed and partial snapshots do not count, else they could push out all the good ones
+            successful += snapshot["state"] == "SUCCESS"
+            continue
+        if older_than is not None and snapshot["start_time_in_millis"] / 1000 > now - older_than:
+            continue
+        selected.append(snapshot["snapshot"])
+    return selected
+
+
+@Pipe()
+def main(
+    dry_run: bool,
+    log: Logger,
+    stack: Annotated[
+        dict,
+        Pipe.State("stack", mutable=True),
+        Pipe.Help("stack where the snapshot repository is registered"),
+        Pipe.Notes("the outcome is stored in [b]snapshot_cleanup[/b] of the stack"),
+    ],
+    repository: Annotated[
+        str,
+        Pipe.Config("repository"),
+        Pipe.Help("name of the snapshot repository to clean up"),
+    ],
+    pattern: Annotated[
+        str,
+        Pipe.Config("pattern"),
+        Pipe.Help("name pattern of the snapshots eligible for deletion (ex. 'nightly-*')"),
+    ] = "*",
+    keep_last: Annotated[
+        Optional[int],
+        Pipe.Config("keep-last"),
+        Pipe.Help("number of the newest successful matching snapshots to keep"),
+    ] = None,
+    older_than: Annotated[
+        Optional[str],
+        Pipe.Config("older-than"),
+        Pipe.Help("minimum age of the snapshots to delete (ex. '30d', '12h')"),
+        Pipe.Notes("at least one of [b]keep-last[/b] and [b]older-than[/b] must be specified"),
+    ] = None,
+    max_length: Annotated[
+        int,
+        Pipe.Config("max-length"),
+        Pipe.Help("maximum length of the URL-encoded snapshot list of each delete request"),
+    ] = MAX_LIST_LENGTH,
+    cleanup: Annotated[
+        bool,
+        Pipe.Config("cleanup"),
+        Pipe.Help("whether to remove the unreferenced data from the repository after the deletion"),
+    ] = True,
+):
+    """Delete old snapshots from a snapshot repository and clean it up."""
+
+    if keep_last is None and older_than is None:
+        log.error("either 'keep-last' or 'older-than' must be specified")
+        sys.exit(1)
+
+    try:
+        older_than_s = parse_duration(older_than) if older_than is not None else None
+    except ValueError as e:
+        log.error(e)
+        sys.exit(1)
+
+    es = instrument_es(get_es_client(stack).options(request_timeout=600), log.name)
+    report = {"repository": repository}
+
+    log.info(f"listing snapshots of repository {repository}: {pattern}")
+    start = time.monotonic()
+    snapshots = list(get_snapshots(es, repository, pattern))
+    report["list_ms"] = round((time.monotonic() - start) * 1000)
+
+    selected = select_snapshots(snapshots, keep_last, older_than_s, time.time())
+    report["snapshots_matched"] = len(snapshots)
+    report["snapshots_selected"] = selected
+    log.info(f"snapshots to delete: {len(selected)} of {len(snapshots)}")
+    log.debug("snapshots to delete:\n  " + "\n  ".join(selected))
+
+    if dry_run:
+        stack["snapshot_cleanup"] = report
+        return
+
+    start = time.monotonic()
+    for batch in batched_by_length(selected, max_length):
+        log.info(f"deleting {len(batch)} snapshots")
+        res = es.snapshot.delete(repository=repository, snapshot=",".join(batch))
+        log.debug(res)
+    report["delete_ms"] = round((time.monotonic() - start) * 1000)
+
+    if cleanup:
+        log.info(f"cleaning up repository: {repository}")
+        start = time.monotonic()
+        res = es.snapshot.cleanup_repository(name=repository)
+        report["cleanup_ms"] = round((time.monotonic() - start) * 1000)
+        report["deleted_bytes"] = res["results"]["deleted_bytes"]
+        report["deleted_blobs"] = res["results"]["deleted_blobs"]
+        log.info(f"repository cleaned up: {report['deleted_blobs']} blobs, {report['deleted_bytes'] / 1e6:.1f}MB freed")
+
+    stack["snapshot_cleanup"] = report
+
+
+if __name__ == "__main__":
+    main()
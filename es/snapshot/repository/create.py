@@ -12,13 +12,31 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import time
 from logging import Logger
 
 from elastic.pipes.core import Pipe
 from elastic.pipes.core.util import get_es_client
+from elastic.pipes.telemetry import instrument_es
+from elasticsearch import NotFoundError
 from typing_extensions import Annotated
 
 
+def normalize_settings(settings: dict, prefix: str = "") -> dict:
+    """Flatten the settings and convert the values to strings, as returned by Elasticsearch."""
+    flat = {}
+    for key, value in settings.items():
+        if isinstance(value, dict):
+            flat.update(normalize_settings(value, f"{prefix}{key}."))
+        elif isinstance(value, bool):
+            flat[f"{prefix}{key}"] = str(value).lower()
+        elif isinstance(value, list):
+            flat[f"{prefix}{key}"] = [str(v) for v in value]
+        else:
+            flat[f"{prefix}{key}"] = str(value)
+    return flat
+
+
 @Pipe()
 def main(
     log: Logger,
@@ -26,6 +44,7 @@ def main(
         dict,
         Pipe.State("stack", mutable=True),
         Pipe.Help("stack where the repository is to be created"),
+        Pipe.Notes("the outcome is stored in [b]repositories.<name>[/b] of the stack"),
     ],
     repository: Annotated[
         str,
@@ -42,8 +61,13 @@ def main(
         Pipe.Config("settings"),
         Pipe.Help("settings for the snapshot repository"),
     ],
+    verify: Annotated[
+        bool,
+        Pipe.Config("verify"),
+        Pipe.Help("whether to verify the repository on all the nodes once created or updated"),
+    ] = True,
 ):
-    """Create a snapshot repository in the given stack."""
+    """Create a snapshot repository in the given stack, unless it exists already."""
 
     body = {
         "type": type,
@@ -51,10 +75,37 @@ def main(
     }
     log.debug(f"body: {body}")
 
-    log.info(f"creating repository: {repository}")
-    sc = get_es_client(stack).snapshot
-    res = sc.create_repository(name=repository, body=body)
-    log.debug(res)
+    sc = instrument_es(get_es_client(stack), log.name).snapshot
+
+    try:
+        current = sc.get_repository(name=repository)[repository]
+    except NotFoundError:
+        current = None
+
+    if current is None:
+        status = "created"
+    elif current["type"] == type and normalize_settings(current.get("settings", {})) == normalize_settings(settings):
+        status = "unchanged"
+    else:
+        status = "updated"
+
+    result = {"status": status}
+    if status == "unchanged":
+        log.info(f"repository unchanged: {repository}")
+    else:
+        log.info(f"{'creating' if status == 'created' else 'updating'} repository: {repository}")
+        res = sc.create_repository(name=repository, body=body, verify=False)
+        log.debug(res)
+
+        if verify:
+            log.info(f"verifying repository: {repository}")
+            start = time.monotonic()
+            res = sc.verify_repository(name=repository)
+            result["verify_ms"] = round((time.monotonic() - start) * 1000)
+            result["verified_nodes"] = sorted(node.get("name", node_id) for node_id, node in res["nodes"].items())
+            log.info(f"repository verified on {len(result['verified_nodes'])} nodes in {result['verify_ms']}ms")
+
+    stack.setdefault("repositories", {})[repository] = result
 
 
 if __name__ == "__main__":
@@ -12,45 +12,508 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
+import re
+import signal
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from logging import Logger
 from typing import Optional
 
 from elastic.pipes.core import Pipe
-from elastic.pipes.core.util import batched, get_es_client
+from elastic.pipes.core.util import get_es_client
+from elastic.pipes.es.snapshot import MAX_LIST_LENGTH, batched_by_length, url_length
+from elastic.pipes.telemetry import instrument_es
+from elasticsearch import ApiError, TransportError
 from typing_extensions import Annotated
 
 
-def get_recovering_indices(es):
-    indices = []
-    res = es.indices.recovery()
+class RestoreError(Exception):
+    pass
+
+
+def get_recoveries(es, indices, max_length=MAX_LIST_LENGTH) -> dict:
+    """Get the shards of `indices` being recovered from a snapshot, by index and shard id.
+
+    Only the active recoveries are requested, with just the fields needed,
+    so that the response size does not grow with the size of the cluster.
+    Index lists longer than `max_length`, URL-encoded, are filtered client
+    side instead of in the URL.
+    """
+    kwargs = {
+        "active_only": True,
+        "filter_path": [
+            "*.shards.id",
+            "*.shards.type",
+            "*.shards.stage",
+            "*.shards.index.size.percent",
+            "*.shards.index.size.total_in_bytes",
+            "*.shards.index.size.recovered_in_bytes",
+        ],
+    }
+    if indices and sum(url_length(index) for index in indices) <= max_length:
+        kwargs.update(index=",".join(indices), ignore_unavailable=True, allow_no_indices=True)
+    wanted = set(indices)
+
+    recoveries = {}
+    res = es.indices.recovery(**kwargs)
     for index, status in res.items():
+        if index not in wanted:
+            continue
         for shard in status["shards"]:
             if shard["type"] == "SNAPSHOT" and shard["stage"] != "DONE":
-                indices.append(f"{index}: {shard['index']['size']['percent']}")
-    return indices
+                recoveries[(index, shard["id"])] = shard["index"]["size"]
+    return recoveries
+
+
+def get_recovering_indices(es, indices, max_length=MAX_LIST_LENGTH):
+    """Get the indices among `indices` being recovered from a snapshot, with the progress."""
+    return [f"{index}: {size['percent']}" for (index, _), size in get_recoveries(es, indices, max_length).items()]
+
+
+def get_latest_snapshot(es, repository, page_size=100):
+    """Get the name of the latest successful snapshot of the repository, if any.
+
+    Snapshots are requested sorted by end time, one page at a time and
+    without the index lists, until a successful one is found.
+    """
+    kwargs = {
+        "repository": repository,
+        "snapshot": "*",
+        "sort": "end_time",
+        "order": "desc",
+        "size": page_size,
+        "index_names": False,
+        "filter_path": ["snapshots.snapshot", "snapshots.state", "next"],
+    }
+    while True:
+        res = es.snapshot.get(**kwargs)
+        for snapshot in res.get("snapshots", []):
+            if snapshot["state"] == "SUCCESS":
+                return snapshot["snapshot"]
+        if not res.get("next"):
+            return None
+        kwargs["after"] = res["next"]
+
+
+def close_indices_batches(log, es, indices, max_length, concurrency):
+    """Close the open indices among `indices`, in concurrent batches."""
+    res = es.cat.indices(h="index", format="json", expand_wildcards=["open", "hidden"])
+    open_indices = {row["index"] for row in res}
+    indices = [index for index in indices if index in open_indices]
+    if not indices:
+        log.info("no open indices to close")
+        return
+
+    def close(batch):
+        log.info("closing indices:\n  " + "\n  ".join(batch))
+        es.indices.close(index=",".join(batch), ignore_unavailable=True)
+
+    batches = list(batched_by_length(indices, max_length))
+    log.info(f"closing {len(indices)} indices in {len(batches)} batches")
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # consume the results to propagate the errors
+        list(executor.map(close, batches))
+
+
+def plan_incremental_restore(es, repository, snapshot) -> dict:
+    """Decide which indices of the snapshot need to be restored.
+
+    An index is skipped if it exists with the same number of primary shards
+    and the same primary store size as in the snapshot, as right after
+    being restored from it and not written since.
+
+    Returns:
+        The indices to "restore", with the reason, and those to "skip"
+    """
+    res = es.snapshot.get(repository=repository, snapshot=snapshot, index_details=True)
+    indices = res["snapshots"][0]["indices"]
+    details = res["snapshots"][0].get("index_details", {})
+    res = es.cat.indices(h="index,pri,pri.store.size", bytes="b", format="json", expand_wildcards="all")
+    live = {row["index"]: row for row in res}
+
+    plan = {"restore": {}, "skip": []}
+    for index in indices:
+        detail = details.get(index)
+        row = live.get(index)
+        if row is None:
+            plan["restore"][index] = "missing"
+        elif detail is None:
+            plan["restore"][index] = "no details"
+        elif str(detail.get("shard_count")) != str(row["pri"]):
+            plan["restore"][index] = "shard count differs"
+        elif str(detail.get("size_in_bytes")) != str(row["pri.store.size"]):
+            plan["restore"][index] = "size differs"
+        else:
+            plan["skip"].append(index)
+    return plan
+
+
+class RestoreProgress:
+    """Aggregated progress of the shards being recovered from the snapshot.
+
+    Shards no longer reported as active are accounted as fully recovered.
+    The throughput is smoothed across the polls.
+    """
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.shards = {}
+        self.last = None
+        self.throughput = None
+
+    def update(self, recoveries: dict):
+        for key, size in self.shards.items():
+            if key not in recoveries:
+                size["recovered_in_bytes"] = size["total_in_bytes"]
+        self.shards.update(recoveries)
+
+        now = time.monotonic()
+        recovered = self.recovered()
+        if self.last is not None and now > self.last[0]:
+            rate = (recovered - self.last[1]) / (now - self.last[0])
+            self.throughput = rate if self.throughput is None else 0.7 * self.throughput + 0.3 * rate
+        self.last = (now, recovered)
+
+    def total(self) -> int:
+        return sum(size.get("total_in_bytes", 0) for size in self.shards.values())
+
+    def recovered(self) -> int:
+        return sum(size.get("recovered_in_bytes", 0) for size in self.shards.values())
+
+    def eta(self) -> Optional[float]:
+        if not self.throughput or self.throughput <= 0:
+            return None
+        return (self.total() - self.recovered()) / self.throughput
+
+    def summary(self, active: int) -> dict:
+        total = self.total()
+        recovered = self.recovered()
+        eta = self.eta()
+        return {
+            "elapsed_s": round(time.monotonic() - self.start, 1),
+            "shards_total": len(self.shards),
+            "shards_active": active,
+            "bytes_total": total,
+            "bytes_recovered": recovered,
+            "percent": round(100 * recovered / total, 1) if total else 0.0,
+            "throughput_mb_s": round((self.throughput or 0) / 1e6, 1),
+            "eta_s": round(eta) if eta is not None else None,
+        }
+
+    def next_poll(self, minimum: float, maximum: float) -> float:
+        """Seconds before the next poll.
+
+        The interval grows as the restore gets long and shrinks as it gets
+        close to completion.
+        """
+        interval = max(minimum, min(maximum, (time.monotonic() - self.start) / 10))
+        if (eta := self.eta()) is not None:
+            interval = min(interval, max(minimum, eta))
+        return interval
+
+
+def parse_rate(value) -> float:
+    """Convert an Elasticsearch byte size per second (ex. '40mb') to bytes, 0 and below mean unlimited."""
+    units = {"b": 1, "kb": 1 << 10, "mb": 1 << 20, "gb": 1 << 30, "tb": 1 << 40, "pb": 1 << 50}
+    if not (match := re.fullmatch(r"(-?[\d.]+)\s*([kmgtp]?b)?", str(value).strip().lower())):
+        raise ValueError(f"invalid byte size: '{value}'")
+    size = float(match.group(1)) * units[match.group(2) or "b"]
+    return size if size > 0 else float("inf")
+
+
+@contextlib.contextmanager
+def interruptible(stop: threading.Event):
+    """Turn SIGTERM and SIGINT into KeyboardInterrupt and set `stop` for the restores running in other threads.
+
+    By default SIGTERM ends the process without unwinding the stack, the
+    fast restore limits would not be put back. Only the first signal is
+    turned into an exception, so that the limits are put back without
+    further interruptions. Nothing is done outside of the main thread.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def handler(signum, frame):
+        if not stop.is_set():
+            stop.set()
+            raise KeyboardInterrupt(signal.Signals(signum).name)
+
+    previous = {signum: signal.signal(signum, handler) for signum in (signal.SIGTERM, signal.SIGINT)}
+    try:
+        yield
+    finally:
+        for signum, prev in previous.items():
+            signal.signal(signum, prev)
+
+
+class FastRestore:
+    """Raise the recovery limits of the cluster and of the repository for the duration of the restore.
+
+    Limits are only raised, never lowered: a setting already at or above
+    the fast restore value is left untouched. The cluster limits are put
+    back as soon as any node is under heap pressure. On exit, also if
+    interrupted, the original persistent and transient cluster settings
+    and the repository settings are put back.
+    """
+
+    RECOVERY_RATE = "indices.recovery.max_bytes_per_sec"
+    CONCURRENT_RECOVERIES = "cluster.routing.allocation.node_concurrent_recoveries"
+    INITIAL_PRIMARIES_RECOVERIES = "cluster.routing.allocation.node_initial_primaries_recoveries"
+
+    def __init__(self, log, es, repository, recovery_rate, restore_rate, concurrent_recoveries=None, max_heap_percent=85):
+        self.log = log
+        self.es = es
+        self.repository = repository
+        self.recovery_rate = recovery_rate
+        self.restore_rate = restore_rate
+        self.concurrent_recoveries = concurrent_recoveries
+        self.max_heap_percent = max_heap_percent
+        self.original = None
+        self.original_repository = None
+        self.pressure = {"heap_percent": 0, "cpu_percent": 0, "relaxed": False}
+
+    def compute_concurrent_recoveries(self) -> int:
+        """Half the processors of the smallest data node, at least the Elasticsearch default of 2."""
+        res = self.es.nodes.info(metric="os", filter_path=["nodes.*.roles", "nodes.*.os.allocated_processors"])
+        processors = [
+            node["os"]["allocated_processors"]
+            for node in res.get("nodes", {}).values()
+            if any(role.startswith("data") for role in node.get("roles", []))
+        ]
+        return max(2, min(processors, default=0) // 2)
+
+    def __enter__(self):
+        res = self.es.cluster.get_settings(flat_settings=True, include_defaults=True)
+        keys = (self.RECOVERY_RATE, self.CONCURRENT_RECOVERIES, self.INITIAL_PRIMARIES_RECOVERIES)
+        original = {kind: {key: res.get(kind, {}).get(key) for key in keys} for kind in ("persistent", "transient")}
+        effective = {key: original["transient"][key] or original["persistent"][key] or res.get("defaults", {}).get(key) for key in keys}
+
+        # snapshot shards are recovered as initial primaries, throttled separately from the replicas
+        concurrent_recoveries = self.concurrent_recoveries or self.compute_concurrent_recoveries()
+        boost = {}
+        if effective[self.RECOVERY_RATE] is None or parse_rate(self.recovery_rate) > parse_rate(effective[self.RECOVERY_RATE]):
+            boost[self.RECOVERY_RATE] = self.recovery_rate
+        for key in (self.CONCURRENT_RECOVERIES, self.INITIAL_PRIMARIES_RECOVERIES):
+            if effective[key] is None or concurrent_recoveries > int(effective[key]):
+                boost[key] = concurrent_recoveries
+        for key in keys:
+            if key not in boost:
+                self.log.info(f"keeping {key}: {effective[key]}")
+
+        if boost:
+            # a transient value would shadow the persistent one
+            persistent = {key: value for key, value in boost.items() if original["transient"][key] is None}
+            transient = {key: value for key, value in boost.items() if key not in persistent}
+            self.log.info(f"raising the recovery limits: {boost}")
+            self.es.cluster.put_settings(persistent=persistent, transient=transient)
+            self.original = {kind: {key: value for key, value in values.items() if key in boost} for kind, values in original.items()}
+
+        try:
+            current = self.es.snapshot.get_repository(name=self.repository)[self.repository]
+            # unset means unlimited, the restore is then throttled by the recovery rate only
+            rate = current.get("settings", {}).get("max_restore_bytes_per_sec", "0")
+            if parse_rate(self.restore_rate) <= parse_rate(rate):
+                self.log.info(f"keeping the restore rate of repository {self.repository}: {rate}")
+                return self
+            settings = dict(current.get("settings", {}), max_restore_bytes_per_sec=self.restore_rate)
+            self.log.info(f"raising the restore rate of repository {self.repository}: {self.restore_rate}")
+            self.es.snapshot.create_repository(name=self.repository, body={"type": current["type"], "settings": settings}, verify=False)
+        except BaseException:
+            self.relax()
+            raise
+        self.original_repository = {"type": current["type"], "settings": current.get("settings", {})}
+        return self
+
+    def relax(self):
+        """Put back the original cluster settings, if not yet done."""
+        if self.original is None:
+            return
+        self.log.info("restoring the original recovery limits")
+        self.es.cluster.put_settings(**self.original)
+        self.original = None
+
+    def check_pressure(self) -> dict:
+        """Track the peak heap and cpu usage of the nodes, relax the limits if the heap is under pressure."""
+        res = self.es.nodes.stats(
+            metric=["jvm", "os"],
+            filter_path=["nodes.*.name", "nodes.*.jvm.mem.heap_used_percent", "nodes.*.os.cpu.percent"],
+        )
+        for node in res.get("nodes", {}).values():
+            heap = node["jvm"]["mem"]["heap_used_percent"]
+            self.pressure["heap_percent"] = max(self.pressure["heap_percent"], heap)
+            self.pressure["cpu_percent"] = max(self.pressure["cpu_percent"], node["os"]["cpu"]["percent"])
+            if heap >= self.max_heap_percent and not self.pressure["relaxed"]:
+                self.log.warning(f"node {node['name']} heap at {heap}%, relaxing the recovery limits")
+                self.relax()
+                self.pressure["relaxed"] = True
+        return self.pressure
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.relax()
+        if self.original_repository is not None:
+            try:
+                self.es.snapshot.create_repository(name=self.repository, body=self.original_repository, verify=False)
+            except ApiError as e:
+                # repositories cannot be updated while a restore is in progress
+                self.log.error(f"could not restore the settings of repository {self.repository}: {e}")
+                self.log.error(f"original repository settings: {self.original_repository}")
+            self.original_repository = None
+
+
+def restore_stack(
+    log: Logger,
+    stack: dict,
+    dry_run: bool,
+    repository: str,
+    snapshot: Optional[str],
+    feature_states: Optional[list],
+    include_aliases: Optional[bool],
+    include_global_state: Optional[bool],
+    close_indices: bool,
+    close_max_length: int,
+    close_concurrency: int,
+    poll_interval: float,
+    max_poll_interval: float,
+    incremental: bool,
+    fast_restore: Optional[dict] = None,
+    prefix: str = "",
+    stop: Optional[threading.Event] = None,
+):
+    """Restore a snapshot in a stack and wait for the recovery to complete.
+
+    If `fast_restore` is given, it holds the arguments of `FastRestore`
+    other than the logger, the client and the repository. If `stop` is
+    given, waiting for the recovery ends as soon as it is set.
+
+    Raises:
+        RestoreError: If the restore cannot be started or is interrupted
+    """
+    es = instrument_es(get_es_client(stack).options(request_timeout=180), log.name)
+
+    log.info(f"checking repository: {repository}")
+    res = es.snapshot.get_repository(name=repository)
+    log.debug(res)
+
+    if snapshot is None:
+        log.info("no snapshot specified, getting the latest snapshot")
+        snapshot = get_latest_snapshot(es, repository)
+        if snapshot is None:
+            raise RestoreError(f"no successful snapshots found in repository: {repository}")
+        log.info(f"latest snapshot: {snapshot}")
+    stack["restore_snapshot"] = snapshot
+
+    log.info(f"checking snapshot: {snapshot}")
+    res = es.snapshot.get(repository=repository, snapshot=snapshot)
+    log.debug(res)
+    snapshot_indices = res["snapshots"][0]["indices"]
+
+    log.info("checking if any snapshot index is already being restored")
+    if indices := get_recovering_indices(es, snapshot_indices, close_max_length):
+        raise RestoreError("indices being restored from snapshot:\n  " + "\n  ".join(indices))
+
+    if incremental:
+        log.info("comparing the snapshot indices with the live ones")
+        stack["restore_plan"] = plan = plan_incremental_restore(es, repository, snapshot)
+        log.info(f"indices to restore: {len(plan['restore'])}, to skip: {len(plan['skip'])}")
+        log.debug("indices to restore:\n  " + "\n  ".join(f"{index}: {reason}" for index, reason in plan["restore"].items()))
+        snapshot_indices = list(plan["restore"])
+        if not snapshot_indices:
+            log.info("all the indices are up to date, nothing to restore")
+            return
+
+    if dry_run:
+        return
+
+    if close_indices:
+        log.info("closing indices soon overwritten by the snapshot restore")
+        close_indices_batches(log, es, snapshot_indices, close_max_length, close_concurrency)
+
+    kwargs = {
+        "repository": repository,
+        "snapshot": snapshot,
+        "wait_for_completion": False,
+    }
+    if feature_states is not None:
+        kwargs["feature_states"] = feature_states
+    if include_aliases is not None:
+        kwargs["include_aliases"] = include_aliases
+    if include_global_state is not None:
+        kwargs["include_global_state"] = include_global_state
+    if incremental:
+        kwargs["indices"] = snapshot_indices
+
+    if stop is not None and stop.is_set():
+        raise RestoreError("restore interrupted")
+
+    tuning = FastRestore(log, es, repository, **fast_restore) if fast_restore is not None else None
+    with tuning or contextlib.nullcontext():
+        log.info("restoring snapshot")
+        res = es.snapshot.restore(**kwargs)
+        log.debug(res)
+
+        if tuning is None:
+            log.info("you can kill this application, the restore will remain in progress")
+        else:
+            log.info("you can kill this application, the restore will remain in progress with the original limits")
+        progress = RestoreProgress()
+        recoveries = get_recoveries(es, snapshot_indices, close_max_length)
+        while recoveries:
+            progress.update(recoveries)
+            stack["restore"] = summary = progress.summary(len(recoveries))
+            if tuning is not None:
+                summary["pressure"] = tuning.check_pressure()
+            eta = f"{summary['eta_s']}s" if summary["eta_s"] is not None else "unknown"
+            print(
+                f"{prefix}restoring {summary['shards_active']} shards: {summary['percent']}% of {summary['bytes_total'] / 1e9:.1f}GB, "
+                f"{summary['throughput_mb_s']}MB/s, ETA {eta}"
+            )
+            log.debug(
+                "indices being restored from snapshot:\n  "
+                + "\n  ".join(f"{index}[{shard}]: {size['percent']}" for (index, shard), size in recoveries.items())
+            )
+            delay = progress.next_poll(poll_interval, max_poll_interval)
+            if stop is None:
+                time.sleep(delay)
+            elif stop.wait(delay):
+                raise RestoreError("restore interrupted")
+            recoveries = get_recoveries(es, snapshot_indices, close_max_length)
+
+    progress.update(recoveries)
+    stack["restore"] = progress.summary(0)
+    if tuning is not None:
+        stack["restore"]["pressure"] = tuning.pressure
+    log.info(f"restore completed: {stack['restore']}")
 
 
 @Pipe()
 def main(
     dry_run: bool,
     log: Logger,
-    stack: Annotated[
-        dict,
-        Pipe.State("stack", mutable=True),
-        Pipe.Help("state node destination of the stack info"),
-    ],
     repository: Annotated[
         str,
         Pipe.Config("repository"),
         Pipe.Help("name of the snapshot repository to restore from"),
     ],
+    stack: Annotated[
+        Optional[dict],
+        Pipe.State("stack", mutable=True),
+        Pipe.Help("state node destination of the stack info"),
+    ] = None,
+    stacks: Annotated[
+        Optional[dict],
+        Pipe.State("stacks", mutable=True),
+        Pipe.Help("state node of the stacks to restore concurrently, by name"),
+        Pipe.Notes("either [b]stack[/b] or [b]stacks[/b] may be specified, not both"),
+    ] = None,
     snapshot: Annotated[
         Optional[str],
         Pipe.Config("snapshot"),
         Pipe.Help("name of the snapshot to restore"),
-        Pipe.Notes("default: latest successful snapshot"),
+        Pipe.Notes("default: latest successful snapshot, as seen by the first of the [b]stacks[/b]"),
     ] = None,
     feature_states: Annotated[
         Optional[list],
@@ -72,74 +535,141 @@ def main(
         Pipe.Config("close-indices"),
         Pipe.Help("whether to close indices before restoring the snapshot"),
     ] = False,
+    close_max_length: Annotated[
+        int,
+        Pipe.Config("close-max-length"),
+        Pipe.Help("maximum length of the URL-encoded index list of each close and recovery request"),
+    ] = MAX_LIST_LENGTH,
+    close_concurrency: Annotated[
+        int,
+        Pipe.Config("close-concurrency"),
+        Pipe.Help("number of close requests issued concurrently"),
+    ] = 4,
+    poll_interval: Annotated[
+        float,
+        Pipe.Config("poll-interval"),
+        Pipe.Help("minimum seconds between restore progress polls"),
+    ] = 5,
+    max_poll_interval: Annotated[
+        float,
+        Pipe.Config("max-poll-interval"),
+        Pipe.Help("maximum seconds between restore progress polls"),
+        Pipe.Notes("the interval grows with the restore duration and shrinks close to completion"),
+    ] = 60,
+    incremental: Annotated[
+        bool,
+        Pipe.Config("incremental"),
+        Pipe.Help("restore only the indices missing or differing from those in the snapshot"),
+        Pipe.Notes("indices are compared by number of primary shards and primary store size"),
+    ] = False,
+    fast_restore: Annotated[
+        bool,
+        Pipe.Config("fast-restore"),
+        Pipe.Help("raise the recovery and restore rate limits for the duration of the restore"),
+        Pipe.Notes("the original cluster and repository settings are put back once done or interrupted"),
+    ] = False,
+    fast_recovery_rate: Annotated[
+        str,
+        Pipe.Config("fast-recovery-rate"),
+        Pipe.Help("value of [b]indices.recovery.max_bytes_per_sec[/b] during a fast restore"),
+        Pipe.Notes(
+            "applied only if above the effective cluster value; as a cluster setting it also overrides "
+            "the higher defaults that Elasticsearch computes for dedicated cold and frozen nodes"
+        ),
+    ] = "250mb",
+    fast_restore_rate: Annotated[
+        str,
+        Pipe.Config("fast-restore-rate"),
+        Pipe.Help("value of the repository [b]max_restore_bytes_per_sec[/b] during a fast restore"),
+        Pipe.Notes("0 means unlimited"),
+    ] = "0",
+    fast_concurrent_recoveries: Annotated[
+        Optional[int],
+        Pipe.Config("fast-concurrent-recoveries"),
+        Pipe.Help(
+            "value of [b]cluster.routing.allocation.node_concurrent_recoveries[/b] and "
+            "[b]node_initial_primaries_recoveries[/b] during a fast restore"
+        ),
+        Pipe.Notes("default: half the processors of the smallest data node, at least 2"),
+    ] = None,
+    fast_max_heap_percent: Annotated[
+        int,
+        Pipe.Config("fast-max-heap-percent"),
+        Pipe.Help("node heap usage at which the original recovery limits are put back"),
+    ] = 85,
 ):
-    """Restore a snapshot from a snapshot repository in the given stack."""
-
-    es = get_es_client(stack).options(request_timeout=180)
+    """Restore a snapshot from a snapshot repository in the given stack(s)."""
 
-    log.info("checking if any snapshot is already being restored")
-    if indices := get_recovering_indices(es):
-        print(
-            "indices being restored from snapshot:\n  " + "\n  ".join(indices),
-            file=sys.stderr,
-        )
+    if (stack is None) == (stacks is None):
+        log.error("either 'stack' or 'stacks' must be specified")
         sys.exit(1)
 
-    log.info(f"checking repository: {repository}")
-    res = es.snapshot.get_repository(name=repository)
-    log.debug(res)
-
-    if snapshot is None:
-        log.info("no snapshot specified, getting the latest snapshot")
-        res = es.snapshot.get(repository=repository, snapshot="_all")
-        snapshots = [s for s in res["snapshots"] if s["state"] == "SUCCESS"]
-        if not snapshots:
-            log.error(f"no successful snapshots found in repository: {repository}")
-            sys.exit(1)
-        snapshots.sort(key=lambda s: s["end_time_in_millis"], reverse=True)
-        snapshot = snapshots[0]["snapshot"]
-        log.info(f"latest snapshot: {snapshot}")
+    kwargs = {
+        "dry_run": dry_run,
+        "repository": repository,
+        "snapshot": snapshot,
+        "feature_states": feature_states,
+        "include_aliases": include_aliases,
+        "include_global_state": include_global_state,
+        "close_indices": close_indices,
+        "close_max_length": close_max_length,
+        "close_concurrency": close_concurrency,
+        "poll_interval": poll_interval,
+        "max_poll_interval": max_poll_interval,
+        "incremental": incremental,
+    }
+    if fast_restore:
+        kwargs["fast_restore"] = {
+            "recovery_rate": fast_recovery_rate,
+            "restore_rate": fast_restore_rate,
+            "concurrent_recoveries": fast_concurrent_recoveries,
+            "max_heap_percent": fast_max_heap_percent,
+        }
 
-    log.info(f"checking snapshot: {snapshot}")
-    res = es.snapshot.get(repository=repository, snapshot=snapshot)
-    log.debug(res)
+    # without a handler, SIGTERM would leave the fast restore limits in place
+    kwargs["stop"] = stop = threading.Event()
+    guard = interruptible(stop) if fast_restore else contextlib.nullcontext()
 
-    if dry_run:
+    if stack is not None:
+        try:
+            with guard:
+                restore_stack(log, stack, **kwargs)
+        except RestoreError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
         return
 
-    if close_indices:
-        log.info("closing indices soon overwritten by the snapshot restore")
-        indices = res["snapshots"][0]["indices"]
-        for i, batch in enumerate(batched(indices, 20)):
-            prefix = "closing indices:\n  " if i == 0 else "  "
-            log.info(prefix + "\n  ".join(batch))
-            es.indices.close(
-                index=",".join(batch),
-                ignore_unavailable=True,
-            )
+    if snapshot is None and stacks:
+        # resolved once, all the stacks are restored from the same snapshot
+        name = next(iter(stacks))
+        log.info(f"no snapshot specified, getting the latest snapshot from stack: {name}")
+        try:
+            snapshot = get_latest_snapshot(instrument_es(get_es_client(stacks[name]), log.name), repository)
+        except (ApiError, TransportError) as e:
+            log.error(f"{name}: could not get the latest snapshot: {e}")
+            sys.exit(1)
+        if snapshot is None:
+            log.error(f"no successful snapshots found in repository: {repository}")
+            sys.exit(1)
+        log.info(f"latest snapshot: {snapshot}")
+        kwargs["snapshot"] = snapshot
 
-    kwargs = {
-        "repository": repository,
-        "snapshot": snapshot,
-        "wait_for_completion": False,
-    }
-    if feature_states is not None:
-        kwargs["feature_states"] = feature_states
-    if include_aliases is not None:
-        kwargs["include_aliases"] = include_aliases
-    if include_global_state is not None:
-        kwargs["include_global_state"] = include_global_state
+    def restore(name):
+        try:
+            restore_stack(log.getChild(name), stacks[name], prefix=f"{name}: ", **kwargs)
+        except (RestoreError, ApiError, TransportError) as e:
+            log.error(f"{name}: restore failed: {e}")
+            stacks[name]["restore_error"] = str(e)
+            return False
+        stacks[name].pop("restore_error", None)
+        return True
 
-    log.info("restoring snapshot")
-    res = es.snapshot.restore(**kwargs)
-    log.debug(res)
+    with guard, ThreadPoolExecutor(max_workers=len(stacks) or 1) as executor:
+        outcome = dict(zip(stacks, executor.map(restore, stacks)))
 
-    log.info("you can kill this application, the restore will remain in progress")
-    indices = get_recovering_indices(es)
-    while indices:
-        print("indices being restored from snapshot:\n  " + "\n  ".join(indices))
-        time.sleep(5)
-        indices = get_recovering_indices(es)
+    if failed := [name for name, ok in outcome.items() if not ok]:
+        log.error(f"restore failed in {len(failed)} of {len(stacks)} stacks: {', '.join(failed)}")
+        sys.exit(1)
 
 
 if __name__ == "__main__":
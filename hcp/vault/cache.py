@@ -0,0 +1,109 @@
+"""Cache of the data read from Vault."""
+
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+# secret caches shared by all the pipes of the run, keyed by file and token
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(token: str, file: Optional[str] = None, ttl: float = 300, size: int = 256) -> "SecretCache":
+    """Get the cache shared by the pipes using the same file and token."""
+    with _caches_lock:
+        if (file, token) not in _caches:
+            cache = SecretCache(token, file, ttl, size)
+            cache.load()
+            _caches[(file, token)] = cache
+        return _caches[(file, token)]
+
+
+class SecretCache:
+    """LRU cache of Vault read responses.
+
+    Entries live in memory for the whole run and, if a file is given, also
+    on disk across runs, encrypted with a key derived from the Vault token.
+    Entries expire after `ttl` seconds or at the end of their lease, if
+    sooner. Beyond `size` entries, the least recently used are evicted.
+    """
+
+    def __init__(self, token: str, file: Optional[str] = None, ttl: float = 300, size: int = 256):
+        self.token = token
+        self.file = Path(file).expanduser() if file else None
+        self.ttl = ttl
+        self.size = size
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.dirty = False
+
+    def fernet(self):
+        from cryptography.fernet import Fernet
+
+        secret = hashlib.sha256(f"elastic-pipes vault cache\n{self.token}".encode()).digest()
+        return Fernet(base64.urlsafe_b64encode(secret))
+
+    def load(self):
+        """Load the entries from the file, if any.
+
+        Raises:
+            ImportError: If the cryptography package is not installed
+        """
+        if not self.file:
+            return
+        from cryptography.fernet import InvalidToken
+
+        if self.file.exists():
+            try:
+                entries = json.loads(self.fernet().decrypt(self.file.read_bytes()))
+            except (InvalidToken, ValueError):
+                entries = []
+            now = time.time()
+            with self.lock:
+                self.entries = {key: entry for key, entry in entries if entry["expires_at"] > now}
+
+    def save(self):
+        """Save the entries to the file, if any and changed."""
+        with self.lock:
+            if not self.file or not self.dirty:
+                return
+            now = time.time()
+            entries = [(key, entry) for key, entry in self.entries.items() if entry["expires_at"] > now]
+            self.file.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(self.file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.fernet().encrypt(json.dumps(entries).encode()))
+            self.dirty = False
+
+    def key(self, url: str, path: str) -> str:
+        # the token is part of the key, cached secrets are never shared across tokens
+        return hashlib.sha256(f"{url}\n{self.token}\n{path}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        """Get the response of an entry not yet expired, mark it as the most recently used."""
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return None
+            if entry["expires_at"] <= time.time():
+                self.dirty = True
+                return None
+            self.entries[key] = entry
+            return entry["response"]
+
+    def put(self, key: str, response: dict):
+        """Store a response, until the end of its lease if sooner than the TTL."""
+        expires_at = time.time() + self.ttl
+        if lease_duration := response.get("lease_duration"):
+            expires_at = min(expires_at, time.time() + lease_duration)
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = {"response": response, "expires_at": expires_at}
+            while len(self.entries) > self.size:
+                del self.entries[next(iter(self.entries))]
+            self.dirty = True
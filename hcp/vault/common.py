@@ -1,10 +1,89 @@
+import atexit
 import os
 import sys
+import threading
+import time
 from pathlib import Path
+from typing import Tuple
 
+import hvac
 from elastic.pipes.core import Pipe
+from elastic.pipes.telemetry import instrument_session, pipe_span
 from typing_extensions import Annotated
 
+# Vault clients shared by all the pipes of the run, keyed by URL and token
+_clients = {}
+_clients_lock = threading.Lock()
+
+# monotonic time until which the token of each client is known valid
+_authenticated = {}
+
+# tokens already read, keyed by file path
+_token_files = {}
+
+
+@atexit.register
+def close_clients():
+    """Close all the shared Vault clients."""
+    with _clients_lock:
+        while _clients:
+            _, client = _clients.popitem()
+            client.adapter.close()
+        _authenticated.clear()
+
+
+def resolve_credentials(logger, url=None, token=None, token_file=None) -> Tuple[str, str]:
+    """Get the Vault URL and token, by default from the environment VAULT_ADDR and VAULT_TOKEN.
+
+    Errors are logged and exit.
+    """
+    if not url and (url := os.environ.get("VAULT_ADDR")):
+        logger.debug("    read URL from environment 'VAULT_ADDR'")
+    if token and token_file:
+        logger.error("both 'token' and 'token-file' are specified")
+        sys.exit(1)
+    elif token_file:
+        token_file = Path(token_file).expanduser()
+        if token := _token_files.get(token_file) or token_file.read_text():
+            logger.debug(f"    read token from file '{token_file}'")
+            _token_files[token_file] = token
+    elif not token:
+        if token := os.environ.get("VAULT_TOKEN", None):
+            logger.debug("    read token from environment 'VAULT_TOKEN'")
+
+    if not url:
+        logger.error("Vault URL is not defined")
+        sys.exit(1)
+    if not token:
+        logger.error("Vault token is not defined")
+        sys.exit(1)
+    return url, token
+
+
+def get_client(logger, url: str, token: str) -> hvac.Client:
+    """Get the Vault client shared by the run for `url` and `token`.
+
+    The token is checked once, then again only after its TTL expired.
+    Authentication errors are logged and exit.
+    """
+    key = (url, token)
+    with _clients_lock:
+        if key not in _clients:
+            logger.info(f"connect to '{url}'")
+            client = hvac.Client(url=url, token=token)
+            instrument_session(client.adapter.session, "vault")
+            _clients[key] = client
+        client = _clients[key]
+        if _authenticated.get(key, 0) <= time.monotonic():
+            try:
+                ttl = client.auth.token.lookup_self()["data"].get("ttl") or 0
+            except Exception:
+                logger.exception("Vault could not authenticate")
+                sys.exit(1)
+            # tokens without TTL do not expire
+            _authenticated[key] = time.monotonic() + ttl if ttl else float("inf")
+        return client
+
 
 class Context(Pipe.Context):
     notes = "Either [b]token[/b] or [b]token-file[/b] may be specified, not both."
@@ -28,25 +107,14 @@ class Context(Pipe.Context):
     ] = None
 
     def __init__(self):
-        if not self.url and (url := os.environ.get("VAULT_ADDR")):
-            self.logger.debug("    read URL from environment 'VAULT_ADDR'")
-            self.url = url
-        if self.token and self.token_file:
-            self.logger.error("both 'token' and 'token-file' are specified")
-            sys.exit(1)
-        elif self.token_file:
-            token_file = Path(self.token_file).expanduser()
-            if token := token_file.read_text():
-                self.logger.debug(f"    read token from file '{token_file}'")
-                self.token = token
-        elif not self.token:
-            if token := os.environ.get("VAULT_TOKEN", None):
-                self.logger.debug("    read token from environment 'VAULT_TOKEN'")
-                self.token = token
-
-        if not self.url:
-            self.logger.error("Vault URL is not defined")
-            sys.exit(1)
-        if not self.token:
-            self.logger.error("Vault token is not defined")
-            sys.exit(1)
+        self.url, self.token = resolve_credentials(self.logger, self.url, self.token, self.token_file)
+
+    def __enter__(self):
+        self.span = pipe_span(self.logger.name)
+        self.span.__enter__()
+        self.client = get_client(self.logger, self.url, self.token)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # the client is shared with the other pipes, it's closed at exit
+        self.span.__exit__(exc_type, exc_value, traceback)
@@ -1,51 +1,200 @@
 #!/usr/bin/env python3
 
+import contextvars
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from logging import Logger
+from typing import Optional, Tuple
 
 import hvac
+import requests
 from elastic.pipes.core import Pipe
 from typing_extensions import Annotated
 
+from .cache import SecretCache, get_cache
 from .common import Context
 
 
+class ReadError(Exception):
+    pass
+
+
+def read_path(log: Logger, vc: hvac.Client, path: str, cache: Optional[SecretCache] = None) -> dict:
+    """Read the data at a Vault path.
+
+    Cached KV v2 data (paths containing '/data/') is reused only if its
+    version is still the current one, as per the metadata endpoint. Other
+    cached data is reused until it expires.
+
+    Raises:
+        ReadError: If the path cannot be read
+    """
+    try:
+        if cache is not None:
+            key = cache.key(vc.url, path)
+            if (res := cache.get(key)) is not None and is_current(log, vc, path, res):
+                log.info(f"read from cache '{path}'")
+                return res["data"]
+
+        log.info(f"read from path '{path}'")
+        res = vc.read(path)
+    except (hvac.exceptions.VaultError, requests.RequestException) as e:
+        raise ReadError(f"could not read path: '{path}': {e}") from e
+    if res is None:
+        raise ReadError(f"could not read path: '{path}'")
+
+    if cache is not None:
+        cache.put(key, res)
+    return res["data"]
+
+
+def is_current(log: Logger, vc: hvac.Client, path: str, res: dict) -> bool:
+    """Check whether a cached response is still current."""
+    if "/data/" not in path:
+        return True
+    try:
+        metadata = vc.read(path.replace("/data/", "/metadata/", 1))
+    except hvac.exceptions.Forbidden:
+        log.debug(f"cannot read the metadata of path '{path}'")
+        return False
+    version = ((res["data"] or {}).get("metadata") or {}).get("version")
+    return metadata is not None and version is not None and metadata["data"]["current_version"] == version
+
+
+def read_paths(
+    log: Logger, vc: hvac.Client, paths: dict, concurrency: int, fail_fast: bool, cache: Optional[SecretCache] = None
+) -> Tuple[dict, dict]:
+    """Read the Vault paths concurrently.
+
+    Args:
+        paths: The paths to read, by destination key
+        concurrency: Maximum number of paths read at the same time
+        fail_fast: Stop at the first path that cannot be read
+        cache: The cache of the data read, if any
+
+    Returns:
+        The data and the errors, by destination key
+    """
+    data = {}
+    errors = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(paths)))) as executor:
+        # each task runs in a copy of the context, to preserve the pipe span
+        futures = {executor.submit(contextvars.copy_context().run, read_path, log, vc, path, cache): key for key, path in paths.items()}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                data[key] = future.result()
+            except ReadError as e:
+                errors[key] = str(e)
+                if fail_fast:
+                    for f in futures:
+                        f.cancel()
+                    break
+    return data, errors
+
+
 @Pipe("elastic.pipes.hcp.vault.read")
 def main(
     log: Logger,
     ctx: Context,
-    path: Annotated[
-        str,
-        Pipe.Config("path"),
-        Pipe.Help("Vault path containing the source data"),
-    ],
     vault: Annotated[
         dict,
         Pipe.State("vault", mutable=True),
         Pipe.Help("state node destination of the data"),
     ],
+    path: Annotated[
+        Optional[str],
+        Pipe.Config("path"),
+        Pipe.Help("Vault path containing the source data"),
+    ] = None,
+    paths: Annotated[
+        Optional[dict],
+        Pipe.Config("paths"),
+        Pipe.Help("Vault paths containing the source data, by key of the destination state node"),
+        Pipe.Notes("either [b]path[/b] or [b]paths[/b] may be specified, not both"),
+    ] = None,
+    concurrency: Annotated[
+        int,
+        Pipe.Config("concurrency"),
+        Pipe.Help("maximum number of [b]paths[/b] read at the same time"),
+    ] = 8,
+    fail_fast: Annotated[
+        bool,
+        Pipe.Config("fail-fast"),
+        Pipe.Help("stop at the first of the [b]paths[/b] that cannot be read"),
+        Pipe.Notes("otherwise the keys of the paths that cannot be read are left out and the errors recorded"),
+    ] = True,
+    errors: Annotated[
+        Optional[dict],
+        Pipe.State("vault-errors", mutable=True),
+        Pipe.Help("state node destination of the errors, by key of the [b]paths[/b]"),
+    ] = None,
+    cache: Annotated[
+        bool,
+        Pipe.Config("cache"),
+        Pipe.Help("reuse the data read earlier in the run, or from [b]cache-file[/b], while unchanged"),
+        Pipe.Notes("KV v2 data is revalidated with its metadata, leased data is reused until the lease ends"),
+    ] = False,
+    cache_file: Annotated[
+        Optional[str],
+        Pipe.Config("cache-file"),
+        Pipe.Help("encrypted file where to cache the data read across runs"),
+        Pipe.Notes("requires the 'key-cache' extra (cryptography package)"),
+    ] = None,
+    cache_ttl: Annotated[
+        float,
+        Pipe.Config("cache-ttl"),
+        Pipe.Help("seconds the cached data is reused at most"),
+    ] = 300,
+    cache_size: Annotated[
+        int,
+        Pipe.Config("cache-size"),
+        Pipe.Help("maximum number of cached paths, the least recently used are evicted"),
+    ] = 256,
 ):
     """Read data from an HCP Vault instance."""
 
-    log.info(f"connect to '{ctx.url}'")
-    vc = hvac.Client(url=ctx.url, token=ctx.token)
+    if (path is None) == (paths is None):
+        log.error("either 'path' or 'paths' must be specified")
+        sys.exit(1)
 
-    try:
-        if not vc.is_authenticated():
-            log.error("Vault could not authenticate")
+    vc = ctx.client
+
+    secret_cache = None
+    if cache:
+        try:
+            secret_cache = get_cache(ctx.token, cache_file, cache_ttl, cache_size)
+        except ImportError as e:
+            log.error(f"cannot use the cache file: {e}")
             sys.exit(1)
-    except Exception:
-        log.exception("Vault could not authenticate")
-        sys.exit(1)
 
-    log.info(f"read from path '{path}'")
-    res = vc.read(path)
-    if res is None:
-        log.error(f"could not read path: '{path}'")
+    if path is not None:
+        try:
+            data = read_path(log, vc, path, secret_cache)
+        except ReadError as e:
+            log.error(e)
+            sys.exit(1)
+        finally:
+            if secret_cache is not None:
+                secret_cache.save()
+
+        vault.clear()
+        vault.update(data)
+        return
+
+    data, failed = read_paths(log, vc, paths, concurrency, fail_fast, secret_cache)
+    if secret_cache is not None:
+        secret_cache.save()
+    for error in failed.values():
+        log.error(error)
+    if failed and fail_fast:
         sys.exit(1)
 
     vault.clear()
-    vault.update(res["data"])
+    vault.update(data)
+    if errors is not None:
+        errors.clear()
+        errors.update(failed)
 
 
 if __name__ == "__main__":
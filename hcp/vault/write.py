@@ -1,47 +1,215 @@
 #!/usr/bin/env python3
 
+import contextvars
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from logging import Logger
+from typing import Optional
 
 import hvac
+import requests
 from elastic.pipes.core import Pipe
 from typing_extensions import Annotated
 
 from .common import Context
 
 
+def is_write_only(e: hvac.exceptions.VaultError) -> bool:
+    """Whether the error means that the path can be written but not read, by policy or by nature."""
+    if isinstance(e, (hvac.exceptions.Forbidden, hvac.exceptions.UnsupportedOperation)):
+        return True
+    # hvac maps the 405 of the write-only endpoints to UnexpectedError
+    return isinstance(e, hvac.exceptions.UnexpectedError) and "unsupported operation" in str(e)
+
+
+def get_current_version(log: Logger, vc: hvac.Client, path: str) -> Optional[int]:
+    """Get the current version of a KV v2 path from its metadata, also if deleted.
+
+    Returns:
+        The version, 0 if never written, None if the metadata is not readable
+    """
+    try:
+        metadata = vc.read(path.replace("/data/", "/metadata/", 1))
+    except hvac.exceptions.VaultError as e:
+        if not is_write_only(e):
+            raise
+        log.info(f"metadata not readable, writing without check-and-set: '{path}'")
+        return None
+    return metadata["data"]["current_version"] if metadata is not None else 0
+
+
+def write_path(log: Logger, vc: hvac.Client, path: str, data: dict, source_version: bool = False) -> str:
+    """Write the data at a Vault path, unless unchanged.
+
+    On KV v2 paths (those containing '/data/') `data` is as read, with the
+    secret in "data" and optionally its "metadata". The write is a
+    check-and-set against the version of the path just read, deleted
+    versions included, or, with `source_version`, against the version in
+    the metadata of `data`, if any, when it was read from this same path.
+
+    Paths that the token or the endpoint does not allow to read are
+    written without comparison and, unless `source_version` applies,
+    without check-and-set.
+
+    Returns:
+        "written", "skipped" or "conflicting"
+
+    Raises:
+        ValueError: If the data of a KV v2 path is not in "data"
+    """
+    kv2 = "/data/" in path
+    if kv2 and "data" not in data:
+        raise ValueError("no 'data' in the source data of a KV v2 path")
+
+    readable = True
+    try:
+        current = vc.read(path)
+    except hvac.exceptions.VaultError as e:
+        if not is_write_only(e):
+            raise
+        log.info(f"path not readable, writing without comparison: '{path}'")
+        readable = False
+        current = None
+
+    if not kv2:
+        if current is not None and current["data"] == data:
+            log.info(f"path unchanged: '{path}'")
+            return "skipped"
+        log.info(f"write to path '{path}'")
+        vc.write_data(path, data=data)
+        return "written"
+
+    secret = data["data"]
+    version = None
+    if current is not None and current["data"]:
+        if current["data"].get("data") == secret:
+            log.info(f"path unchanged: '{path}'")
+            return "skipped"
+        version = current["data"]["metadata"]["version"]
+    elif readable:
+        # the latest version may be deleted, check-and-set is against it all the same
+        version = get_current_version(log, vc, path)
+    if source_version:
+        version = (data.get("metadata") or {}).get("version", version)
+
+    if version is None:
+        log.info(f"write to path '{path}'")
+        vc.write_data(path, data={"data": secret})
+        return "written"
+
+    log.info(f"write to path '{path}', version {version}")
+    try:
+        vc.write_data(path, data={"options": {"cas": version}, "data": secret})
+    except hvac.exceptions.InvalidRequest as e:
+        if "check-and-set" not in str(e):
+            raise
+        log.warning(f"path changed since version {version}: '{path}'")
+        return "conflicting"
+    return "written"
+
+
+def write_paths(log: Logger, vc: hvac.Client, paths: dict, vault: dict, concurrency: int, source_version: bool = False) -> dict:
+    """Write the Vault paths concurrently.
+
+    Args:
+        paths: The paths to write, by key of the source data in `vault`
+        concurrency: Maximum number of paths written at the same time
+        source_version: Check-and-set against the version of the source data
+
+    Returns:
+        The keys "written", "skipped" and "conflicting", the errors by key in "failed"
+    """
+
+    def write(key):
+        try:
+            if key not in vault:
+                raise ValueError(f"no source data '{key}'")
+            return write_path(log, vc, paths[key], vault[key], source_version)
+        except (ValueError, hvac.exceptions.VaultError, requests.RequestException) as e:
+            log.error(f"could not write path: '{paths[key]}': {e}")
+            return e
+
+    report = {"written": [], "skipped": [], "conflicting": [], "failed": {}}
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(paths)))) as executor:
+        # each task runs in a copy of the context, to preserve the pipe span
+        results = executor.map(lambda key: contextvars.copy_context().run(write, key), paths)
+        for key, result in zip(paths, results):
+            if isinstance(result, Exception):
+                report["failed"][key] = str(result)
+            else:
+                report[result].append(key)
+    return report
+
+
 @Pipe("elastic.pipes.hcp.vault.write")
 def main(
     log: Logger,
     ctx: Context,
-    path: Annotated[
-        str,
-        Pipe.Config("path"),
-        Pipe.Help("Vault path destination of the data"),
-    ],
     vault: Annotated[
         dict,
         Pipe.State("vault", mutable=True),
         Pipe.Help("state node containing the source data"),
     ],
+    path: Annotated[
+        Optional[str],
+        Pipe.Config("path"),
+        Pipe.Help("Vault path destination of the data"),
+    ] = None,
+    paths: Annotated[
+        Optional[dict],
+        Pipe.Config("paths"),
+        Pipe.Help("Vault paths destination of the data, by key of the source state node"),
+        Pipe.Notes(
+            "either [b]path[/b] or [b]paths[/b] may be specified, not both; "
+            "unchanged paths are skipped, KV v2 paths are written with check-and-set; "
+            "paths not readable are written unconditionally"
+        ),
+    ] = None,
+    concurrency: Annotated[
+        int,
+        Pipe.Config("concurrency"),
+        Pipe.Help("maximum number of [b]paths[/b] written at the same time"),
+    ] = 8,
+    cas_source_version: Annotated[
+        bool,
+        Pipe.Config("cas-source-version"),
+        Pipe.Help("check-and-set KV v2 paths against the version in the metadata of the source data"),
+        Pipe.Notes(
+            "only when the data was read from the same paths, to detect the changes made since; "
+            "default: against the version of the destination read just before writing"
+        ),
+    ] = False,
+    report: Annotated[
+        Optional[dict],
+        Pipe.State("vault-write", mutable=True),
+        Pipe.Help("state node destination of the keys of the [b]paths[/b] written, skipped and conflicting"),
+    ] = None,
 ):
     """Write data to an HCP Vault instance."""
 
-    log.info(f"connect to '{ctx.url}'")
-    vc = hvac.Client(url=ctx.url, token=ctx.token)
+    if (path is None) == (paths is None):
+        log.error("either 'path' or 'paths' must be specified")
+        sys.exit(1)
 
-    try:
-        if not vc.is_authenticated():
-            log.error("Vault could not authenticate")
+    vc = ctx.client
+
+    if path is not None:
+        log.info(f"write to path '{path}'")
+        res = vc.write_data(path, data=vault)
+        if res is None:
+            log.error(f"could not write path: '{path}'")
             sys.exit(1)
-    except Exception:
-        log.exception("Vault could not authenticate")
-        sys.exit(1)
+        return
+
+    outcome = write_paths(log, vc, paths, vault, concurrency, cas_source_version)
+    log.info(f"paths written: {len(outcome['written'])}, skipped: {len(outcome['skipped'])}, conflicting: {len(outcome['conflicting'])}")
+
+    if report is not None:
+        report.clear()
+        report.update(outcome)
 
-    log.info(f"write to path '{path}'")
-    res = vc.write_data(path, data=vault)
-    if res is None:
-        log.error(f"could not write path: '{path}'")
+    if outcome["conflicting"] or outcome["failed"]:
+        log.error(f"could not write {len(outcome['conflicting']) + len(outcome['failed'])} of {len(paths)} paths")
         sys.exit(1)
 
 
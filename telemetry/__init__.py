@@ -0,0 +1,382 @@
+# Copyright 2026 Elasticsearch B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Latency metrics and trace spans of the outbound calls of the pipes.
+
+Every call is recorded with its method, templated endpoint, status, bytes
+and timings, attributed to the pipe in progress. The records are exported
+by the `elastic.pipes.telemetry.report` pipe.
+"""
+
+import contextlib
+import contextvars
+import os
+import re
+import threading
+import time
+from typing import Callable, Optional
+
+import httpx
+
+# latency histogram bucket boundaries, in milliseconds
+BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+_ID_RE = re.compile(r"^([0-9a-fA-F]{16,}|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}|\d+)$")
+
+_current_pipe = contextvars.ContextVar("current_pipe", default=None)
+
+
+def template_endpoint(path: str) -> str:
+    """Replace the identifiers in a URL path with a placeholder.
+
+    Hex strings of 16 or more digits, UUIDs and numbers are considered
+    identifiers, ex. "/deployments/{id}/elasticsearch/_main/keystore".
+    """
+    path = path.split("?", 1)[0]
+    return "/".join("{id}" if _ID_RE.match(segment) else segment for segment in path.split("/"))
+
+
+class Recorder:
+    """Collector of the calls and pipe spans of the run."""
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.calls = []
+        self.pipes = {}
+        self.lock = threading.Lock()
+
+    def pipe_started(self, pipe: str):
+        with self.lock:
+            self.pipes.setdefault(pipe, {"span_id": os.urandom(8).hex(), "start": time.time_ns(), "end": None})
+
+    def pipe_ended(self, pipe: str):
+        with self.lock:
+            if pipe in self.pipes:
+                self.pipes[pipe]["end"] = time.time_ns()
+
+    def record(
+        self,
+        method: str,
+        endpoint: str,
+        start: int,
+        end: int,
+        *,
+        service: str,
+        status: Optional[int] = None,
+        sent: Optional[int] = None,
+        received: Optional[int] = None,
+        timings: Optional[dict] = None,
+        retries: int = 0,
+        error: Optional[str] = None,
+        pipe: Optional[str] = None,
+    ):
+        """Record a call, times are in nanoseconds since the epoch."""
+        pipe = pipe or _current_pipe.get() or "-"
+        call = {
+            "pipe": pipe,
+            "service": service,
+            "method": method,
+            "endpoint": endpoint,
+            "status": status,
+            "sent": sent,
+            "received": received,
+            "duration_ms": (end - start) / 1e6,
+            "timings_ms": timings or {},
+            "retries": retries,
+            "start": start,
+            "end": end,
+        }
+        if error:
+            call["error"] = error
+        self.pipe_started(pipe)
+        with self.lock:
+            self.calls.append(call)
+
+    def histograms(self) -> dict:
+        """Latency histograms of the calls, by service, method and endpoint."""
+        histograms = {}
+        with self.lock:
+            calls = list(self.calls)
+        for call in calls:
+            key = f"{call['service']} {call['method']} {call['endpoint']}"
+            h = histograms.setdefault(key, {"count": 0, "sum_ms": 0.0, "min_ms": None, "max_ms": None, "buckets": [0] * (len(BUCKETS) + 1)})
+            duration = call["duration_ms"]
+            h["count"] += 1
+            h["sum_ms"] += duration
+            h["min_ms"] = duration if h["min_ms"] is None else min(h["min_ms"], duration)
+            h["max_ms"] = duration if h["max_ms"] is None else max(h["max_ms"], duration)
+            h["buckets"][next((i for i, bound in enumerate(BUCKETS) if duration <= bound), len(BUCKETS))] += 1
+        for h in histograms.values():
+            h["bounds_ms"] = list(BUCKETS)
+        return histograms
+
+    def to_otlp(self) -> dict:
+        """Trace of the run in the OTLP/JSON format, one span per pipe and per call."""
+        with self.lock:
+            calls = list(self.calls)
+            pipes = {name: dict(pipe) for name, pipe in self.pipes.items()}
+
+        spans = []
+        for name, pipe in pipes.items():
+            end = pipe["end"] or max([c["end"] for c in calls if c["pipe"] == name] + [pipe["start"]])
+            spans.append(_span(pipe["span_id"], None, name, pipe["start"], end, kind=1, attributes={}))
+        for call in calls:
+            attributes = {
+                "http.request.method": call["method"],
+                "url.template": call["endpoint"],
+                "service.target": call["service"],
+                "http.request.body.size": call["sent"],
+                "http.response.body.size": call["received"],
+                "http.response.status_code": call["status"],
+                "http.request.resend_count": call["retries"],
+            }
+            attributes.update({f"timing.{k}_ms": v for k, v in call["timings_ms"].items()})
+            name = f"{call['method']} {call['endpoint']}"
+            parent = pipes[call["pipe"]]["span_id"]
+            span = _span(os.urandom(8).hex(), parent, name, call["start"], call["end"], kind=3, attributes=attributes)
+            if call.get("error") or (call["status"] or 0) >= 400:
+                span["status"] = {"code": 2, "message": call.get("error", "")}
+            spans.append(span)
+
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": [_attribute("service.name", "elastic-pipes")]},
+                    "scopeSpans": [{"scope": {"name": __name__}, "spans": [dict(span, traceId=self.trace_id) for span in spans]}],
+                }
+            ]
+        }
+
+
+def _attribute(key, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def _span(span_id, parent_id, name, start, end, kind, attributes) -> dict:
+    span = {
+        "spanId": span_id,
+        "name": name,
+        "kind": kind,
+        "startTimeUnixNano": str(start),
+        "endTimeUnixNano": str(end),
+        "attributes": [_attribute(k, v) for k, v in attributes.items() if v is not None],
+    }
+    if parent_id:
+        span["parentSpanId"] = parent_id
+    return span
+
+
+recorder = Recorder()
+
+
+@contextlib.contextmanager
+def pipe_span(pipe: str):
+    """Attribute the calls issued within the block, also by async tasks, to the pipe."""
+    token = _current_pipe.set(pipe)
+    recorder.pipe_started(pipe)
+    try:
+        yield
+    finally:
+        recorder.pipe_ended(pipe)
+        _current_pipe.reset(token)
+
+
+def httpcore_trace(timings: dict, is_async: bool = False) -> Callable:
+    """Make an httpx "trace" extension collecting the connection and server timings.
+
+    httpcore requires a coroutine function for the async transports, pass
+    `is_async` to get one. DNS resolution is not reported separately by
+    httpcore, it is part of the connect timing.
+    """
+    started = {}
+
+    def record(event: str):
+        name, _, phase = event.rpartition(".")
+        now = time.perf_counter()
+        if phase == "started":
+            started[name] = now
+        elif phase in ("complete", "failed") and name in started:
+            step = name.split(".", 1)[-1]
+            timings[step] = (now - started[name]) * 1000
+
+    def trace(event: str, info: dict):
+        record(event)
+
+    async def atrace(event: str, info: dict):
+        record(event)
+
+    return atrace if is_async else trace
+
+
+def summarize_timings(timings: dict) -> dict:
+    """Reduce the httpcore steps to connect, TLS and server timings."""
+    summary = {}
+    if "connect_tcp" in timings:
+        summary["connect"] = timings["connect_tcp"]
+    if "start_tls" in timings:
+        summary["tls"] = timings["start_tls"]
+    if "receive_response_headers" in timings:
+        summary["server"] = timings["receive_response_headers"]
+    return summary
+
+
+class _SyncCountingStream(httpx.SyncByteStream):
+    def __init__(self, stream, done):
+        self.stream = stream
+        self.done = done
+        self.size = 0
+
+    def __iter__(self):
+        for chunk in self.stream:
+            self.size += len(chunk)
+            yield chunk
+
+    def close(self):
+        self.stream.close()
+        self.done(self.size)
+
+
+class _AsyncCountingStream(httpx.AsyncByteStream):
+    def __init__(self, stream, done):
+        self.stream = stream
+        self.done = done
+        self.size = 0
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            self.size += len(chunk)
+            yield chunk
+
+    async def aclose(self):
+        await self.stream.aclose()
+        self.done(self.size)
+
+
+def record_httpx(
+    request: httpx.Request,
+    response: Optional[httpx.Response],
+    start: int,
+    *,
+    service: str,
+    timings: dict,
+    retries: int = 0,
+    error: Optional[Exception] = None,
+    is_async: bool = False,
+):
+    """Record an httpx call once its response body is consumed.
+
+    Args:
+        request: The request sent
+        response: The response received, None on error
+        start: The start time, in nanoseconds since the epoch
+        service: The name of the remote service
+        timings: The timings collected with `httpcore_trace`
+        retries: The number of retries
+        error: The error raised instead of returning a response
+        is_async: Whether the response stream is async
+    """
+    pipe = _current_pipe.get()
+    try:
+        sent = len(request.content)
+    except httpx.RequestNotRead:
+        sent = None
+
+    def done(received=None):
+        recorder.record(
+            request.method,
+            template_endpoint(request.url.path),
+            start,
+            time.time_ns(),
+            service=service,
+            status=response.status_code if response is not None else None,
+            sent=sent,
+            received=received,
+            timings=summarize_timings(timings),
+            retries=retries,
+            error=str(error) if error else None,
+            pipe=pipe,
+        )
+
+    if response is None:
+        done()
+    elif is_async:
+        response.stream = _AsyncCountingStream(response.stream, done)
+    else:
+        response.stream = _SyncCountingStream(response.stream, done)
+
+
+def instrument_es(es, pipe: Optional[str] = None):
+    """Record the calls issued by an Elasticsearch client instance.
+
+    The endpoint is the API name, ex. "indices.recovery".
+    """
+    perform_request = es.perform_request
+
+    def instrumented(method, path, *, endpoint_id=None, **kwargs):
+        start = time.time_ns()
+        status = error = received = None
+        try:
+            response = perform_request(method, path, endpoint_id=endpoint_id, **kwargs)
+            status = response.meta.status
+            received = response.meta.headers.get("content-length")
+            return response
+        except Exception as e:
+            status = getattr(getattr(e, "meta", None), "status", None)
+            error = str(e)
+            raise
+        finally:
+            recorder.record(
+                method,
+                endpoint_id or template_endpoint(path),
+                start,
+                time.time_ns(),
+                service="elasticsearch",
+                status=status,
+                received=int(received) if received else None,
+                error=error,
+                pipe=pipe,
+            )
+
+    es.perform_request = instrumented
+    return es
+
+
+def instrument_session(session, service: str, pipe: Optional[str] = None):
+    """Record the calls issued by a requests session, ex. that of hvac."""
+
+    def hook(response, *args, **kwargs):
+        end = time.time_ns()
+        request = response.request
+        body = request.body or b""
+        recorder.record(
+            request.method,
+            template_endpoint(request.path_url),
+            end - int(response.elapsed.total_seconds() * 1e9),
+            end,
+            service=service,
+            status=response.status_code,
+            sent=len(body),
+            received=len(response.content),
+            timings={"server": response.elapsed.total_seconds() * 1000},
+            pipe=pipe,
+        )
+
+    session.hooks.setdefault("response", []).append(hook)
+    return session
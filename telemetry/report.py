@@ -0,0 +1,70 @@
+# Copyright 2026 Elasticsearch B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Report the outbound calls of the previous pipes: latency histograms per
+endpoint and trace spans per pipe.
+
+https://opentelemetry.io/docs/specs/otlp/#json-protobuf-encoding
+"""
+
+import json
+from logging import Logger
+from pathlib import Path
+from typing import Optional
+
+from elastic.pipes.core import Pipe
+from elastic.pipes.telemetry import recorder
+from typing_extensions import Annotated
+
+
+@Pipe("elastic.pipes.telemetry.report")
+def main(
+    log: Logger,
+    telemetry: Annotated[
+        Optional[dict],
+        Pipe.State("telemetry", mutable=True),
+        Pipe.Help("state node destination of the calls and the latency histograms"),
+    ] = None,
+    file: Annotated[
+        Optional[str],
+        Pipe.Config("file"),
+        Pipe.Help("file destination of the trace, in the OTLP/JSON format"),
+    ] = None,
+    calls: Annotated[
+        bool,
+        Pipe.Config("calls"),
+        Pipe.Help("whether to store also the single calls in the state node"),
+    ] = False,
+):
+    """Report latency histograms and trace spans of the outbound calls."""
+
+    histograms = recorder.histograms()
+    for endpoint, h in sorted(histograms.items(), key=lambda item: item[1]["sum_ms"], reverse=True):
+        log.info(f"{endpoint}: {h['count']} calls, {h['sum_ms']:.0f}ms total, {h['max_ms']:.0f}ms max")
+
+    if telemetry is not None:
+        telemetry.clear()
+        telemetry["histograms"] = histograms
+        if calls:
+            telemetry["calls"] = list(recorder.calls)
+
+    if file:
+        path = Path(file).expanduser()
+        log.info(f"writing trace to '{path}'")
+        path.write_text(json.dumps(recorder.to_otlp()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# Copyright 2026 Elasticsearch B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import httpx
+from elastic.pipes.ec.cache import ResponseCache
+
+URL = "https://api.example.com/api/v1/deployments"
+
+
+def get():
+    return httpx.Request("GET", URL, headers={"Authorization": "ApiKey key"})
+
+
+def test_revalidation(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+
+    request = get()
+    key, entry = cache.prepare(request)
+    assert entry is None
+    response = httpx.Response(200, headers={"ETag": '"v1"'}, content=b'{"a": 1}', request=request)
+    cache.complete(request, response, key, entry)
+
+    # a new cache on the same directory finds the entry on disk
+    cache = ResponseCache(str(tmp_path))
+    request = get()
+    key, entry = cache.prepare(request)
+    assert request.headers["If-None-Match"] == '"v1"'
+    response = cache.complete(request, httpx.Response(304, request=request), key, entry)
+    assert response.status_code == 200
+    assert response.json() == {"a": 1}
+
+
+def test_not_cached():
+    cache = ResponseCache()
+
+    request = httpx.Request("POST", URL)
+    assert cache.prepare(request) == (None, None)
+
+    # responses without validators are not stored
+    request = get()
+    key, entry = cache.prepare(request)
+    cache.complete(request, httpx.Response(200, content=b"{}", request=request), key, entry)
+    assert cache.prepare(get())[1] is None
+
+
+def test_expired(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl=-1)
+    request = get()
+    key, entry = cache.prepare(request)
+    cache.complete(request, httpx.Response(200, headers={"ETag": '"v1"'}, content=b"{}", request=request), key, entry)
+    assert cache.load(key) is None
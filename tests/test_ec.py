@@ -0,0 +1,99 @@
+# Copyright 2026 Elasticsearch B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import http.server
+import json
+import logging
+import threading
+
+import pytest
+from elastic.pipes.ec import (
+    AsyncContext,
+    Context,
+    handle_async_response,
+    handle_response,
+)
+from elastic.pipes.telemetry import recorder
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body = json.dumps({"path": self.path}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def make_context(cls, api_url, **settings):
+    # the context is not bound to a pipe, set the configuration directly
+    ec = cls.__new__(cls)
+    ec.auth_key = "test-key"
+    ec.api_url = api_url
+    if not hasattr(ec, "logger"):
+        ec.logger = logging.getLogger(__name__)
+    for name, value in settings.items():
+        setattr(ec, name, value)
+    return ec
+
+
+@pytest.fixture
+def api_url():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/api/v1"
+    server.shutdown()
+    server.server_close()
+
+
+def test_async_request(api_url):
+    ec = make_context(AsyncContext, api_url)
+
+    async def get(path):
+        return await handle_async_response(await ec.request("GET", path), logging.getLogger(__name__))
+
+    assert ec.run(get, "/deployments") == {"path": "/api/v1/deployments"}
+
+    call = recorder.calls[-1]
+    assert call["service"] == "elastic-cloud"
+    assert call["status"] == 200
+    assert "server" in call["timings_ms"]
+
+
+def test_policies_per_pipe(api_url):
+    first = make_context(Context, api_url)
+    second = make_context(Context, api_url, cache=True, retries=0, rate_limit=1)
+
+    with first, second:
+        assert first.client._transport.transport is second.client._transport.transport
+        assert first.client._transport.cache is None
+        assert second.client._transport.cache is not None
+        assert first.client._transport.retry.retries == 3
+        assert second.client._transport.retry.retries == 0
+        assert first.client._transport.limiter is None
+        assert second.client._transport.limiter is not None
+
+        assert handle_response(second.client.get("/deployments"), logging.getLogger(__name__)) == {"path": "/api/v1/deployments"}
+
+    # once set, the rate limit applies to the following pipes
+    third = make_context(Context, api_url)
+    with third:
+        assert third.client._transport.limiter is second.client._transport.limiter
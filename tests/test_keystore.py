@@ -0,0 +1,57 @@
+# Copyright 2026 Elasticsearch B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from elastic.pipes.ec.deployments.es.keystore.update import (
+    diff_secrets,
+    digest_secret,
+    record_digests,
+    select_changes,
+)
+
+KEY = "auth-key"
+
+
+def test_diff_secrets_without_current():
+    secrets = {"a": {"value": "1"}, "b": None}
+    assert diff_secrets(None, secrets, {}, KEY) == {"added": [], "changed": ["a"], "removed": ["b"], "unchanged": []}
+
+
+def test_diff_secrets():
+    secrets = {
+        "new": {"value": "1"},
+        "same": {"value": "2"},
+        "other": {"value": "3"},
+        "file": {"value": "4", "as_file": True},
+        "gone": None,
+    }
+    current = {"same": {}, "other": {}, "file": {}, "gone": {}}
+    digests = {name: digest_secret(KEY, secret) for name, secret in secrets.items() if secret is not None and name != "other"}
+    assert diff_secrets(current, secrets, digests, KEY) == {
+        "added": ["new"],
+        "changed": ["other", "file"],
+        "removed": ["gone"],
+        "unchanged": ["same"],
+    }
+
+
+def test_diff_secrets_removed_absent():
+    assert diff_secrets({}, {"gone": None}, {}, KEY)["unchanged"] == ["gone"]
+
+
+def test_record_digests():
+    secrets = {"a": {"value": "1"}, "b": None}
+    digests = {"b": "old"}
+    record_digests(digests, select_changes(secrets, diff_secrets(None, secrets, {}, KEY)), KEY)
+    assert digests == {"a": digest_secret(KEY, {"value": "1"})}
@@ -0,0 +1,131 @@
+# Copyright 2026 Elasticsearch B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import logging
+import os
+import signal
+import threading
+
+import pytest
+from elastic.pipes.es.snapshot.restore import FastRestore, interruptible, parse_rate
+
+log = logging.getLogger(__name__)
+
+
+class FakeCluster:
+    def __init__(self, persistent=None, transient=None, defaults=None):
+        self.settings = {"persistent": persistent or {}, "transient": transient or {}, "defaults": defaults or {}}
+        self.calls = []
+
+    def get_settings(self, flat_settings, include_defaults):
+        return self.settings
+
+    def put_settings(self, persistent=None, transient=None):
+        self.calls.append({"persistent": persistent, "transient": transient})
+
+
+class FakeSnapshot:
+    def __init__(self, settings):
+        self.repository = {"type": "fs", "settings": settings}
+        self.calls = []
+
+    def get_repository(self, name):
+        return {name: self.repository}
+
+    def create_repository(self, name, body, verify):
+        self.calls.append(body)
+
+
+class FakeEs:
+    def __init__(self, repository_settings=None, **settings):
+        self.cluster = FakeCluster(**settings)
+        self.snapshot = FakeSnapshot(repository_settings or {})
+
+
+def fast_restore(es, recovery_rate="250mb", restore_rate="0", concurrent_recoveries=4):
+    return FastRestore(log, es, "repo", recovery_rate, restore_rate, concurrent_recoveries)
+
+
+def test_parse_rate():
+    assert parse_rate("40mb") == 40 << 20
+    assert parse_rate("1.5kb") == 1536
+    assert parse_rate(100) == 100
+    assert parse_rate("0") == float("inf")
+    assert parse_rate("-1") == float("inf")
+    with pytest.raises(ValueError):
+        parse_rate("fast")
+
+
+def test_raise_and_put_back():
+    es = FakeEs(
+        persistent={FastRestore.CONCURRENT_RECOVERIES: "2"},
+        defaults={FastRestore.RECOVERY_RATE: "40mb", FastRestore.INITIAL_PRIMARIES_RECOVERIES: "4"},
+        repository_settings={"location": "/tmp", "max_restore_bytes_per_sec": "40mb"},
+    )
+    with fast_restore(es):
+        pass
+
+    raised, original = es.cluster.calls
+    assert raised == {"persistent": {FastRestore.RECOVERY_RATE: "250mb", FastRestore.CONCURRENT_RECOVERIES: 4}, "transient": {}}
+    assert original == {
+        "persistent": {FastRestore.RECOVERY_RATE: None, FastRestore.CONCURRENT_RECOVERIES: "2"},
+        "transient": {FastRestore.RECOVERY_RATE: None, FastRestore.CONCURRENT_RECOVERIES: None},
+    }
+    assert es.snapshot.calls == [
+        {"type": "fs", "settings": {"location": "/tmp", "max_restore_bytes_per_sec": "0"}},
+        {"type": "fs", "settings": {"location": "/tmp", "max_restore_bytes_per_sec": "40mb"}},
+    ]
+
+
+def test_never_lower():
+    es = FakeEs(
+        transient={FastRestore.RECOVERY_RATE: "1gb"},
+        persistent={FastRestore.CONCURRENT_RECOVERIES: "8", FastRestore.INITIAL_PRIMARIES_RECOVERIES: "8"},
+        repository_settings={"location": "/tmp"},
+    )
+    with fast_restore(es, restore_rate="500mb"):
+        pass
+    assert es.cluster.calls == []
+    assert es.snapshot.calls == []
+
+
+def test_transient_shadows_persistent():
+    es = FakeEs(
+        transient={FastRestore.RECOVERY_RATE: "20mb"},
+        persistent={FastRestore.CONCURRENT_RECOVERIES: "8", FastRestore.INITIAL_PRIMARIES_RECOVERIES: "8"},
+    )
+    with fast_restore(es):
+        pass
+    raised, original = es.cluster.calls
+    assert raised == {"persistent": {}, "transient": {FastRestore.RECOVERY_RATE: "250mb"}}
+    assert original == {"persistent": {FastRestore.RECOVERY_RATE: None}, "transient": {FastRestore.RECOVERY_RATE: "20mb"}}
+
+
+def test_put_back_on_error():
+    es = FakeEs(defaults={FastRestore.RECOVERY_RATE: "40mb"}, repository_settings={"max_restore_bytes_per_sec": "40mb"})
+    with pytest.raises(KeyboardInterrupt), fast_restore(es):
+        raise KeyboardInterrupt
+    assert len(es.cluster.calls) == 2
+    assert es.snapshot.calls[-1] == {"type": "fs", "settings": {"max_restore_bytes_per_sec": "40mb"}}
+
+
+def test_interruptible():
+    stop = threading.Event()
+    previous = signal.getsignal(signal.SIGTERM)
+    with pytest.raises(KeyboardInterrupt), interruptible(stop):
+        os.kill(os.getpid(), signal.SIGTERM)
+        stop.wait(5)
+    assert stop.is_set()
+    assert signal.getsignal(signal.SIGTERM) is previous
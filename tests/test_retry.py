@@ -0,0 +1,51 @@
+# Copyright 2026 Elasticsearch B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import httpx
+from elastic.pipes.ec.retry import RateLimiter, RetryPolicy, parse_retry_after
+
+
+def test_rate_limiter_burst():
+    limiter = RateLimiter(1, 2)
+    assert limiter.reserve() == 0
+    assert limiter.reserve() == 0
+    assert 0.9 < limiter.reserve() <= 1
+
+
+def test_rate_limiter_update():
+    limiter = RateLimiter(1, 10)
+    limiter.update(10, 1)
+    assert limiter.reserve() == 0
+    assert 0.09 < limiter.reserve() <= 0.1
+
+
+def test_retry_policy():
+    policy = RetryPolicy(2, ["get"])
+    get = httpx.Request("GET", "https://example.com")
+    post = httpx.Request("POST", "https://example.com")
+    assert policy.retryable(get, 0)
+    assert policy.retryable(get, 1)
+    assert not policy.retryable(get, 2)
+    assert not policy.retryable(post, 0)
+    assert not RetryPolicy(0, ["GET"]).retryable(get, 0)
+    assert policy.should_retry(httpx.Response(503))
+    assert not policy.should_retry(httpx.Response(500))
+
+
+def test_retry_after():
+    response = httpx.Response(429, headers={"Retry-After": "7"})
+    assert parse_retry_after(response) == 7
+    assert RetryPolicy(3, ["GET"], maximum=1).delay(5, response) == 7
+    assert parse_retry_after(httpx.Response(429)) is None
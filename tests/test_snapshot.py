@@ -0,0 +1,96 @@
+# Copyright 2026 Elasticsearch B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import pytest
+from elastic.pipes.es.snapshot import batched_by_length, parse_duration, url_length
+from elastic.pipes.es.snapshot.cleanup import select_snapshots
+
+DAY = 86400
+NOW = 100 * DAY
+
+
+def snapshot(name, age_days, state="SUCCESS"):
+    return {"snapshot": name, "state": state, "start_time_in_millis": (NOW - age_days * DAY) * 1000}
+
+
+def test_parse_duration():
+    assert parse_duration("30s") == 30
+    assert parse_duration(" 12h ") == 12 * 3600
+    assert parse_duration("2w") == 14 * DAY
+    for duration in ("", "1", "1y", "-1d", "1.5h"):
+        with pytest.raises(ValueError):
+            parse_duration(duration)
+
+
+def test_select_by_count():
+    snapshots = [snapshot(f"s{n}", n) for n in range(5)]
+    assert select_snapshots(snapshots, 2, None, NOW) == ["s2", "s3", "s4"]
+    assert select_snapshots(snapshots, 5, None, NOW) == []
+    assert select_snapshots(snapshots, 0, None, NOW) == ["s0", "s1", "s2", "s3", "s4"]
+
+
+def test_select_by_age():
+    snapshots = [snapshot(f"s{n}", n * 10) for n in range(5)]
+    assert select_snapshots(snapshots, None, 15 * DAY, NOW) == ["s2", "s3", "s4"]
+    assert select_snapshots(snapshots, 3, 15 * DAY, NOW) == ["s3", "s4"]
+    assert select_snapshots(snapshots, 1, 35 * DAY, NOW) == ["s4"]
+
+
+def test_select_in_progress():
+    snapshots = [snapshot("s0", 0, "IN_PROGRESS"), snapshot("s1", 1), snapshot("s2", 50, "IN_PROGRESS"), snapshot("s3", 60)]
+    assert select_snapshots(snapshots, 1, None, NOW) == ["s3"]
+    assert select_snapshots(snapshots, None, 2 * DAY, NOW) == ["s3"]
+
+
+def test_select_failed():
+    snapshots = [
+        snapshot("f0", 0, "FAILED"),
+        snapshot("p1", 1, "PARTIAL"),
+        snapshot("s2", 2),
+        snapshot("f3", 3, "FAILED"),
+        snapshot("s4", 4),
+        snapshot("f5", 5, "FAILED"),
+        snapshot("s6", 6),
+    ]
+    # the failed and partial snapshots never push out the successful ones
+    assert select_snapshots(snapshots, 2, None, NOW) == ["f5", "s6"]
+    assert select_snapshots(snapshots, 3, None, NOW) == []
+    assert select_snapshots(snapshots, None, 2 * DAY, NOW) == ["s2", "f3", "s4", "f5", "s6"]
+
+
+def test_url_length():
+    assert url_length("index") == 6
+    assert url_length("logs-*") == 7
+    assert url_length("a b") == 6
+    assert url_length("é") == 7
+
+
+def test_batched_by_length():
+    names = [f"index-{n}" for n in range(10)]
+    batches = list(batched_by_length(names, 24))
+    assert [name for batch in batches for name in batch] == names
+    assert all(len(",".join(batch)) < 24 for batch in batches)
+    assert [len(batch) for batch in batches] == [3] * 3 + [1]
+
+
+def test_batched_by_length_encoded():
+    names = ["a b", "c d", "e"]
+    assert list(batched_by_length(names, 12)) == [["a b", "c d"], ["e"]]
+    assert list(batched_by_length(names, 11)) == [["a b"], ["c d", "e"]]
+
+
+def test_batched_by_length_long_name():
+    assert list(batched_by_length(["x" * 50, "y"], 10)) == [["x" * 50], ["y"]]
+    assert list(batched_by_length([], 10)) == []
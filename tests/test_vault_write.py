@@ -0,0 +1,149 @@
+# Copyright 2026 Elasticsearch B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import logging
+
+import hvac
+import pytest
+from elastic.pipes.hcp.vault.write import write_path
+
+log = logging.getLogger(__name__)
+
+
+class FakeVault:
+    """In-memory KV v2 mount, as seen through the hvac client."""
+
+    def __init__(self, unreadable=(), unreadable_metadata=()):
+        self.versions = {}
+        self.deleted = set()
+        self.unreadable = unreadable
+        self.unreadable_metadata = unreadable_metadata
+        self.writes = []
+
+    def read(self, path):
+        if "/metadata/" in path:
+            path = path.replace("/metadata/", "/data/", 1)
+            if path in self.unreadable_metadata:
+                raise hvac.exceptions.Forbidden("permission denied")
+            if path not in self.versions:
+                return None
+            return {"data": {"current_version": len(self.versions[path])}}
+        if path in self.unreadable:
+            raise hvac.exceptions.Forbidden("permission denied")
+        if path not in self.versions or path in self.deleted:
+            return None
+        versions = self.versions[path]
+        return {"data": {"data": versions[-1], "metadata": {"version": len(versions)}}}
+
+    def write_data(self, path, data):
+        self.writes.append((path, data))
+        if "/data/" not in path:
+            return
+        versions = self.versions.setdefault(path, [])
+        if "cas" in data.get("options", {}) and data["options"]["cas"] != len(versions):
+            raise hvac.exceptions.InvalidRequest("check-and-set parameter did not match the current version")
+        versions.append(data["data"])
+        self.deleted.discard(path)
+
+
+PATH = "secret/data/test"
+
+
+def test_write_new():
+    vc = FakeVault()
+    assert write_path(log, vc, PATH, {"data": {"a": "1"}}) == "written"
+    assert vc.writes == [(PATH, {"options": {"cas": 0}, "data": {"a": "1"}})]
+
+
+def test_write_unchanged():
+    vc = FakeVault()
+    vc.versions[PATH] = [{"a": "1"}]
+    assert write_path(log, vc, PATH, {"data": {"a": "1"}}) == "skipped"
+    assert vc.writes == []
+
+
+def test_write_changed():
+    vc = FakeVault()
+    vc.versions[PATH] = [{"a": "1"}, {"a": "2"}]
+    assert write_path(log, vc, PATH, {"data": {"a": "3"}}) == "written"
+    assert vc.writes == [(PATH, {"options": {"cas": 2}, "data": {"a": "3"}})]
+
+
+def test_write_source_version():
+    vc = FakeVault()
+    vc.versions[PATH] = [{"a": "1"}, {"a": "2"}]
+    source = {"data": {"a": "3"}, "metadata": {"version": 1}}
+    assert write_path(log, vc, PATH, source, source_version=True) == "conflicting"
+    assert vc.versions[PATH] == [{"a": "1"}, {"a": "2"}]
+
+    source["metadata"]["version"] = 2
+    assert write_path(log, vc, PATH, source, source_version=True) == "written"
+    assert vc.versions[PATH][-1] == {"a": "3"}
+
+
+def test_write_deleted():
+    vc = FakeVault()
+    vc.versions[PATH] = [{"a": "1"}, {"a": "2"}]
+    vc.deleted.add(PATH)
+    assert write_path(log, vc, PATH, {"data": {"a": "2"}}) == "written"
+    assert vc.writes == [(PATH, {"options": {"cas": 2}, "data": {"a": "2"}})]
+
+
+def test_write_unreadable():
+    vc = FakeVault(unreadable=[PATH])
+    vc.versions[PATH] = [{"a": "1"}]
+    assert write_path(log, vc, PATH, {"data": {"a": "1"}}) == "written"
+    assert vc.writes == [(PATH, {"data": {"a": "1"}})]
+
+    source = {"data": {"a": "2"}, "metadata": {"version": 1}}
+    assert write_path(log, vc, PATH, source, source_version=True) == "conflicting"
+
+
+def test_write_unreadable_metadata():
+    vc = FakeVault(unreadable_metadata=[PATH])
+    vc.versions[PATH] = [{"a": "1"}]
+    vc.deleted.add(PATH)
+    assert write_path(log, vc, PATH, {"data": {"a": "2"}}) == "written"
+    assert vc.writes == [(PATH, {"data": {"a": "2"}})]
+
+
+def test_write_kv1():
+    vc = FakeVault(unreadable=["secret/other"])
+    assert write_path(log, vc, "secret/other", {"a": "1"}) == "written"
+    assert vc.writes == [("secret/other", {"a": "1"})]
+
+
+def failing_read(error):
+    def read(path):
+        raise error
+
+    return read
+
+
+def test_write_unexpected_error():
+    vc = FakeVault()
+    vc.read = failing_read(hvac.exceptions.UnexpectedError("server error"))
+    with pytest.raises(hvac.exceptions.UnexpectedError):
+        write_path(log, vc, PATH, {"data": {"a": "1"}})
+    assert vc.writes == []
+
+    vc.read = failing_read(hvac.exceptions.UnexpectedError("1 error occurred: unsupported operation"))
+    assert write_path(log, vc, PATH, {"data": {"a": "1"}}) == "written"
+    assert vc.writes == [(PATH, {"data": {"a": "1"}})]
+
+
+def test_write_without_data():
+    with pytest.raises(ValueError):
+        write_path(log, FakeVault(), PATH, {"a": "1"})